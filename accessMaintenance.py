@@ -14,7 +14,8 @@ import pathlib          # Needed for find subprocess
 import vimeo            # Needed for uploading files to Vimeo
 from datetime import datetime   # This lades the datetime module, used for getting dates and timestamps
 from pprint import pprint
-from airtable import Airtable
+from airtableTools import getAirtablePages, setOfflineMode, syncAirtableMirror, getAirtableRecordsById, logAirtableStats, updateAirtableRecord, flushAirtableUpdates, formulaEquals, formulaNotEquals, formulaAnd, formulaOr
+from mediaInfo import probeFile, hasTrack, getFieldValue, logMediaInfoStats
 
 
 def main():
@@ -24,6 +25,8 @@ def main():
     parser.add_argument('-v', '--verbose', action='count', default=0,help="Defines verbose level for standard out (stdout). v = warning, vv = info, vvv = debug")
     parser.add_argument('-d', '--Debug',dest='d',action='store_true',default=False,help="turns on Debug mode, which send all DEBUG level (and below) messages to the log. By default logging is set to INFO level")
     parser.add_argument('-sa', '--Skip-Audit',dest='sa',action='store_true',default=False,help="Skips drive, airtable, and file audit at beginning of script")
+    parser.add_argument('-sm', '--Sync-Mirror',dest='sm',action='store_true',default=False,help="Refreshes the local copy (mirror) of the Records and Files tables from Airtable before doing anything else")
+    parser.add_argument('-off', '--Offline',dest='off',action='store_true',default=False,help="Reads Records and Files from the local mirror instead of Airtable. Changes are still written to Airtable. Run with -sm first to make sure the mirror is up to date")
     #parser.add_argument('-dv', '--Download-Vimeo',dest='dv',action='store_true',default=False,help="Runs the Vimeo Download subcprocess. This likely won't ever actually need to be run if the archive is being properly maintained")
     parser.add_argument('-sv', '--Sync-Vimeo',dest='sv',action='store_true',default=False,help="Runs the Sync Vimeo subcprocess. This syncs all the airtable info (description, password, etc) to the current Vimeo page")
     parser.add_argument('-ua', '--Upload-Access',dest='ua',nargs='?',type=int,default=0,const=5,help="Runs the Vimeo Upload subcprocess. By default this will upload the first 5 files it finds that need to be uploaded to Vimeo. If you put a number after the -ua flag it will upload that number of files that it finds. Uploader will only update files with set to 'Vimeo' in the Online Platform field")
@@ -73,6 +76,14 @@ def main():
 
     drive_name=config.DRIVE_NAME
 
+    #Refresh the local mirror of Airtable, then read from it if we're running offline
+    if args.sm:
+        syncAirtableMirror()
+    if args.off:
+        if not setOfflineMode(True):
+            logging.critical('========Script Complete========')
+            quit()
+
     #skip audits if run with -sa flag
     if not args.sa:
 
@@ -96,7 +107,9 @@ def main():
                 logging.error('Airtable audit failed. Please fix this before continuing.')
             if not file_audit:
                 logging.error('File audit failed. Please fix this before continuing.')
+            logAirtableStats()
             logging.critical('========Script Complete========')
+            flushAirtableUpdates()     #send anything already queued before quitting
             quit()
 
 
@@ -110,6 +123,7 @@ def main():
         v = connectToVimeo(config.YOUR_ACCESS_TOKEN, config.YOUR_CLIENT_ID, config.YOUR_CLIENT_SECRET)
 
         if v == False:
+            flushAirtableUpdates()
             quit()
 
         if args.ua > 0:
@@ -118,6 +132,8 @@ def main():
         if args.sv:
             syncVimeo(v)
 
+    logAirtableStats()
+    logMediaInfoStats()
     logging.critical('========Script Complete========')
 
 ## End of main function
@@ -229,8 +245,7 @@ def uploadRecordToGdrive(g_dict, counter_dict):
 
     #lastly we update airtable with the ID and URL. awesome!
     try:
-        airtable = Airtable(config.BASE_ID, 'Records', config.API_KEY)
-        airtable.update(g_dict['record_id'], update_dict)
+        updateAirtableRecord('Records', g_dict['record_id'], update_dict)
         logging.info('Succesfully added Google Drive link for record %s ' % g_dict['RID'])
         counter_dict['update_counter'] += 1
     except Exception as e:
@@ -272,8 +287,7 @@ def uploadFileToVimeo(v, vimeoDict, file_path, vimeo_upload_files_dict, counter_
 
     #THIS IS THE IMPORTANT BIT WHERE WE UPDATE THE TABLE!
     try:
-        airtable = Airtable(config.BASE_ID, 'Records', config.API_KEY)
-        airtable.update(vimeo_upload_files_dict['record_id'], update_dict)
+        updateAirtableRecord('Records', vimeo_upload_files_dict['record_id'], update_dict)
         logging.info('Succesfully added Vimeo link for record %s ' % vimeo_upload_files_dict['RID'])
         counter_dict['update_counter'] += 1
     except Exception as e:
@@ -300,13 +314,6 @@ def connectToVimeo(c_token, c_key, c_secret):
 
     return v
 
-def getAirtablePages(table_name):
-    #takes table name, returns pages.
-    #BASE_ID and API_KEY come from config.py file.
-    airtable = Airtable(config.BASE_ID, table_name, config.API_KEY)
-    pages = airtable.get_iter()
-    return pages
-
 def driveAudit():
     #This performs a quick drive audit, checking to see if drive contains every record labeled as "in library" in airtable
     #TODO -> harvest "on drive" info from related file record for more accurate maintenance
@@ -551,8 +558,10 @@ def syncVimeo(v):
     warning_counter = 0
     error_counter = 0
     update_vimeo_dict_list = []
-    pages = getAirtablePages("Records")
-    airtable_files = Airtable(config.BASE_ID, 'Files', config.API_KEY)
+    #only ask Airtable for Vimeo records that have a link, and only the fields we need from them
+    sync_fields = [config.RECORD_NUMBER, config.RECORD_STATUS, config.MEDIA_TYPE, config.ACCESS_PLATFORM, config.ACCESS_LINK, config.ACCESS_PERMISSION, config.RECORD_TITLE, config.INFO_CARD, config.ACCESS_PASSWORD]
+    sync_formula = formulaAnd(formulaNotEquals(config.RECORD_STATUS, config.RECORD_DEACCESS_FLAG), formulaEquals(config.ACCESS_PLATFORM, "Vimeo"), formulaNotEquals(config.ACCESS_LINK, ""))
+    pages = getAirtablePages("Records", fields=sync_fields, formula=sync_formula, mirror_where="online_platform = ? AND (status IS NULL OR status != ?)", mirror_params=("Vimeo", config.RECORD_DEACCESS_FLAG))
     for page in pages:
         for record in page:
             try:
@@ -664,8 +673,18 @@ def uploadAccessSubprocesses(v, quantity):
     error_counter = 0
     vimeo_upload_files_dict_list = []
     gdrive_upload_files_dict_list = []
-    pages = getAirtablePages("Records")
-    airtable_files = Airtable(config.BASE_ID, 'Files', config.API_KEY)
+    #only ask Airtable for Vimeo and Google Drive records that don't have a link yet, and only the fields we need from them
+    upload_fields = [config.RECORD_NUMBER, config.RECORD_STATUS, config.MEDIA_TYPE, config.ACCESS_PLATFORM, config.ACCESS_LINK, config.FILES_IN_RECORD, config.ACCESS_PERMISSION, config.RECORD_TITLE, config.INFO_CARD, config.ACCESS_PASSWORD]
+    upload_formula = formulaAnd(formulaNotEquals(config.RECORD_STATUS, config.RECORD_DEACCESS_FLAG), formulaOr(formulaEquals(config.ACCESS_PLATFORM, "Vimeo"), formulaEquals(config.ACCESS_PLATFORM, "Google Drive")), formulaEquals(config.ACCESS_LINK, ""))
+    pages = getAirtablePages("Records", fields=upload_fields, formula=upload_formula, mirror_where="online_platform IN (?, ?) AND (status IS NULL OR status != ?)", mirror_params=("Vimeo", "Google Drive", config.RECORD_DEACCESS_FLAG))
+
+    #look up the file names for every candidate in one go, instead of asking Airtable once per record
+    file_id_list = []
+    for page in pages:
+        for record in page:
+            file_id_list.extend(record['fields'].get(config.FILES_IN_RECORD, []))
+    files_index = getAirtableRecordsById("Files", file_id_list, fields=[config.FULL_FILE_NAME])
+
     for page in pages:
         for record in page:
             if upload_counter == quantity:
@@ -700,7 +719,7 @@ def uploadAccessSubprocesses(v, quantity):
                             continue
                         else:
                             airtable_filename_id = airtable_filename_list[0]
-                            airtable_filename = airtable_files.get(airtable_filename_id)['fields'][config.FULL_FILE_NAME]
+                            airtable_filename = files_index[airtable_filename_id]['fields'][config.FULL_FILE_NAME]
                     except Exception as e:
                         if "Album" not in media_type:
                             logging.warning('No file associated with record for %s. Skipping for now, please fix this record.' % RID)
@@ -754,7 +773,7 @@ def uploadAccessSubprocesses(v, quantity):
                             continue
                         else:
                             airtable_filename_id = airtable_filename_list[0]
-                            airtable_filename = airtable_files.get(airtable_filename_id)['fields'][config.FULL_FILE_NAME]
+                            airtable_filename = files_index[airtable_filename_id]['fields'][config.FULL_FILE_NAME]
                     except Exception as e:
                         if "Album" not in media_type:
                             logging.warning('No file associated with record for %s. Skipping for now, please fix this record.' % RID)
@@ -798,8 +817,8 @@ def uploadAccessSubprocesses(v, quantity):
     vimeo_upload_files_dict_list_sorted = sorted(vimeo_upload_files_dict_list, key=lambda d: d['RID'])
     counter_dict = {'upload_counter' : 0, 'error_counter' : 0, 'update_counter': 0, 'status' : True}
     for vimeo_upload_files_dict in vimeo_upload_files_dict_list_sorted:
-        mediainfo_text = getMediaInfo(vimeo_upload_files_dict['file_path'])
-        mediainfo_dict = parseMediaInfo(vimeo_upload_files_dict['file_path'], mediainfo_text, vimeo_upload_files_dict['name'],vimeo_upload_files_dict['RID'])
+        tracks = probeFile(vimeo_upload_files_dict['file_path'])
+        mediainfo_dict = parseMediaInfo(vimeo_upload_files_dict['file_path'], tracks, vimeo_upload_files_dict['name'],vimeo_upload_files_dict['RID'])
         reason_list = checkForAccessFile(mediainfo_dict)    #get a list of reasons for why we need an access copy (if we do)
         if not reason_list:
             logging.info("No access copy needed. Starting Vimeo upload")
@@ -817,41 +836,15 @@ def uploadAccessSubprocesses(v, quantity):
         print('Vimeo uploading complete. %i file uploaded, %i airtable records updated, %i errors' % (counter_dict['upload_counter'], counter_dict['update_counter'], counter_dict['error_counter']))
 
 
-def getMediaInfo(filePath):
-    cmd = [ config.MEDIAINFO_PATH, '-f', '--Output=XML', filePath ]
-    media_info = subprocess.Popen( cmd, stdout=subprocess.PIPE ).communicate()[0]
-    return media_info
-
-def parseMediaInfo(filePath, media_info_text, fileName, RID):
+def parseMediaInfo(filePath, tracks, fileName, RID):
     # The following line initializes the dict.
     mediainfo_dict = {config.FILENAME: fileName, config.FILE_SIZE : "", config.VIDEO_SCAN_TYPE : "", config.VIDEO_CODEC : "", config.VIDEO_ASPECT_RATIO : "", 'file_type' : ""}
-    media_info_text = media_info_text.decode()
     logging.info("Parsing mediainfo for record %s, file: %s" % (RID, mediainfo_dict[config.FILENAME]))
-    file_type = None
-    file_has_general = False
-    file_has_video = False
-    file_has_audio = False
+    file_has_video = hasTrack(tracks, "Video")
+    file_has_audio = hasTrack(tracks, "Audio")
 
-    try:
-        mi_General_Text = (media_info_text.split("<track type=\"General\">"))[1].split("</track>")[0]
-        file_has_general = True
-    except:
+    if not hasTrack(tracks, "General"):
         logging.error('The file %s is not a properly formed media file. Please check that this file is correct' %  mediainfo_dict[config.FILENAME])
-    try:
-        mi_Video_Text = (media_info_text.split("<track type=\"Video\">"))[1].split("</track>")[0]
-        file_has_video = True
-    except:
-        file_has_video = False
-    try:
-        mi_Audio_Text = (media_info_text.split("<track type=\"Audio\">"))[1].split("</track>")[0]
-        file_has_audio = True
-    except:
-        file_has_audio = False
-    try:
-        mi_Image_Text = (media_info_text.split("<track type=\"Image\">"))[1].split("</track>")[0]
-        file_has_image = True
-    except:
-        file_has_image = False
 
     if file_has_video and file_has_audio: #Process as video and audio file
         mediainfo_dict['file_type'] = "Video"
@@ -864,28 +857,17 @@ def parseMediaInfo(filePath, media_info_text, fileName, RID):
     # General Stuff
 
     try:
-        mediainfo_dict[config.FILE_SIZE] = int((mi_General_Text.split("<FileSize>"))[1].split("</FileSize>")[0])
-    except:
+        mediainfo_dict[config.FILE_SIZE] = int(getFieldValue(tracks, 'FILE_SIZE'))
+    except (TypeError, ValueError):
         logging.error("MEDIAINFO ERROR: Could not parse File Size for " + mediainfo_dict[config.FILENAME])
 
     # Video Stuff
 
     if mediainfo_dict['file_type'] == "Video" or mediainfo_dict['file_type'] == "Silent_Video":
-        try:
-            mediainfo_dict[config.VIDEO_CODEC] = (mi_Video_Text.split("<CodecID>"))[1].split("</CodecID>")[0]
-        except:
-            try:
-                mediainfo_dict[config.VIDEO_CODEC] = (mi_Video_Text.split("<Format>"))[1].split("</Format>")[0]
-            except:
-                mediainfo_dict[config.VIDEO_CODEC] = "None"
-        try:
-            mediainfo_dict[config.VIDEO_SCAN_TYPE] = (mi_Video_Text.split("<ScanType_String>"))[1].split("</ScanType_String>")[0]
-        except:
-            mediainfo_dict[config.VIDEO_ASPECT_RATIO] = "None"
-        try:
-            mediainfo_dict[config.VIDEO_ASPECT_RATIO] = (mi_Video_Text.split("<DisplayAspectRatio_String>"))[1].split("</DisplayAspectRatio_String>")[0]
-        except:
-            mediainfo_dict[config.VIDEO_ASPECT_RATIO] = "None"
+        mediainfo_dict[config.VIDEO_CODEC] = getFieldValue(tracks, 'VIDEO_CODEC') or "None"
+        if getFieldValue(tracks, 'VIDEO_SCAN_TYPE') is not None:
+            mediainfo_dict[config.VIDEO_SCAN_TYPE] = getFieldValue(tracks, 'VIDEO_SCAN_TYPE')
+        mediainfo_dict[config.VIDEO_ASPECT_RATIO] = getFieldValue(tracks, 'VIDEO_ASPECT_RATIO') or "None"
 
     else:
         mediainfo_dict[config.VIDEO_CODEC] = "None"
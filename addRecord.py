@@ -8,12 +8,13 @@ import sys
 import platform
 import argparse         # This loads the "argparse" module, used for parsing input arguments which allows us to have a verbose mode
 import config
-import hashlib
 import shutil           # Needed for auto-deaccsion subprocess
 import pathlib             # Needed for find subprocess
 from datetime import datetime   # This lades the datetime module, used for getting dates and timestamps
 from pprint import pprint
-from airtable import Airtable
+from fixity import generateHashes, generateFingerprint, getFingerprintField, createFixityUpdate, copyFileWithHashes, writeManifests
+from airtableTools import getAirtableTable, getAirtablePages, logAirtableStats, updateAirtableRecord, queueAirtableUpdate, flushAirtableUpdates, formulaEquals
+from mediaInfo import probeFile, probeFiles, sniffFileType, hasTrack, getFieldValue, getFrameSize, logMediaInfoStats
 
 #List of Dependencies:
 #ffmpeg
@@ -32,6 +33,7 @@ def main():
     parser.add_argument('-b', '--Batch',dest='b',action='store_true',default=False,help="turns on Batch mode, which runs the script in a loop until all new records have been added")
     parser.add_argument('-sa', '--Skip-Audit',dest='sa',action='store_true',default=False,help="Skip Audit mode. In this mode the script will run even if extra folders are on the drive. Use this carefully!")
     parser.add_argument('-aap', '--Album-Auto-Pilot',dest='aap',action='store_true',default=False,help="Album Auto Pilot mode. This will process albums without asking the user for any input unless it finds a problem")
+    parser.add_argument('-st', '--Staging',dest='st',action='store',default=None,help="Ingest mode. Copies each record's file from a staging folder (one folder per record number) into its record folder, computing checksums during the copy. Overrides STAGING_PATH in config.py")
     #parser.add_argument('-r', '--Record',dest='r',action='store',default=None,help="Set the record ID you want to add to the archive")
     #parser.add_argument('-f', '--File',dest='f',action='store',default=None,help="Sets the filepath of the file you want to add to the archive")
     args = parser.parse_args()
@@ -85,10 +87,12 @@ def main():
     if not args.sa: #skip drive audio if run with -sa flag
     #Perform a record-level audit of the drive. Quit upon failure
         if not driveAudit():
+            flushAirtableUpdates()     #send anything already queued before quitting
             quit()
 
     #Performs a record-level audit of the airtable. Quit upon failure
         if not airtableAudit():
+            flushAirtableUpdates()
             quit()
 
     #Creates list of records to be processed
@@ -96,9 +100,12 @@ def main():
 
     if not record_dict_list:    #if list is empty
         logging.info("No records are labeled as ready to update in Airtable (Intaking Local Data File). Please make sure to follow the proper workflow for adding a record to Airtable and try again")
+        flushAirtableUpdates()
         quit()
 
     post_process_list = []
+    ingest_digests = {}     #checksums computed while copying files in from the staging folder, keyed by the file's new path
+    staging_path = args.st or getattr(config, 'STAGING_PATH', '')
 
     if args.b == True:      #if running in batch mode log it
         logging.info("Running in batch mode!")
@@ -106,13 +113,17 @@ def main():
         if not createRecordFolder(record_dict['RID'],args):  #create folder for new record (or use existing if user accepts)
             if post_process_list == []:                 #if nothing else has been processed yet just quit the script.
                 logging.info('Quitting Script')
+                flushAirtableUpdates()
                 quit()
             else:                                        #if we're in batch mode and other rercords have been processed, exit the loop
                 logging.info('Quitting the file processing section, moving onto checksum processing')
                 break
+        if staging_path:
+            ingestFromStaging(record_dict, staging_path, ingest_digests)
         verified_input = verifyUserAddedFile(record_dict,args)    #this portion verifies that file is correct and returns the filepath
         if not verified_input:
             logging.error("There was an error retreiving the file path for the file in folder %s. Please try again" % record_dict_list[0]['RID'])
+            flushAirtableUpdates()
             quit()
         elif os.path.isdir(verified_input):        #process as an album (determined by verifyUserAddedFile())
             input_album_path = verified_input
@@ -128,9 +139,21 @@ def main():
 
     logging.info("Processing checksums, this may take a while, check back in a few minutes")
     for post_process_dict in post_process_list:
-        file_checksum = generateHash(post_process_dict["post_file_path"])
-        updateAirtableField(post_process_dict["file_id"], {config.CHECKSUM: file_checksum}, post_process_dict["post_RID"], "Files")
-
+        file_digests = ingest_digests.get(post_process_dict["post_file_path"])     #files copied in from staging were already hashed during the copy
+        if file_digests is None:
+            file_digests = generateHashes(post_process_dict["post_file_path"])     #every algorithm in FIXITY_ALGORITHMS from one read of the file
+        try:
+            writeManifests(os.path.dirname(post_process_dict["post_file_path"]), {os.path.basename(post_process_dict["post_file_path"]) : file_digests})     #checksum manifest in the record folder, for offline validation
+        except Exception as e:
+            logging.warning('Could not write the checksum manifest for record %s: %s' % (post_process_dict["post_RID"], e))
+        update_dict = createFixityUpdate(file_digests)
+        if getFingerprintField():
+            update_dict[getFingerprintField()] = generateFingerprint(post_process_dict["post_file_path"])     #used by quick validation in recordMaintenance.py
+        queueAirtableUpdate("Files", post_process_dict["file_id"], update_dict, post_process_dict["post_RID"])     #checksums are sent to Airtable in batches
+    flushAirtableUpdates("Files")
+
+    logAirtableStats()
+    logMediaInfoStats()
     logging.critical('========Script Complete========')
 
 ## End of main function
@@ -166,8 +189,8 @@ def processAlbum(record_id, album_path, record_dict_entry):
 
 def processRecord(pres_file_path, record_dict_entry):
     #returns the record id, which we need later for updating the checksum
-    pres_mediainfo_text = getMediaInfo(pres_file_path)
-    pres_airtable_create_dict = parseMediaInfo(pres_file_path, pres_mediainfo_text, record_dict_entry['RID'], record_dict_entry['record_id'])
+    pres_tracks = probeFile(pres_file_path)
+    pres_airtable_create_dict = parseMediaInfo(pres_file_path, pres_tracks, record_dict_entry['RID'], record_dict_entry['record_id'])
     #reason_list = []       #list of reasons to create access files. is empty if no need for access file
     #reason_list = checkForAccessFile(pres_airtable_create_dict)
     #if not reason_list:
@@ -186,8 +209,8 @@ def processRecord(pres_file_path, record_dict_entry):
     #    pres_airtable_create_dict[config.COPY_VERSION] = "Master Copy"
     #    pres_airtable_create_dict[config.USE_FOR_ACCESS] = "No"
     #    access_file_path = createAccessFile(pres_file_path, pres_airtable_create_dict, reason_list)
-    #    access_mediainfo_text = getMediaInfo(access_file_path)
-    #    access_airtable_create_dict = parseMediaInfo(access_file_path, access_mediainfo_text, record_dict_entry['RID'], record_dict_entry['record_id'])
+    #    access_tracks = probeFile(access_file_path)
+    #    access_airtable_create_dict = parseMediaInfo(access_file_path, access_tracks, record_dict_entry['RID'], record_dict_entry['record_id'])
     #    access_airtable_create_dict[config.COPY_VERSION] = "Access Copy"
     #    access_airtable_create_dict[config.USE_FOR_ACCESS] = "Yes"
     #    if createAirtableFileRecord(pres_airtable_create_dict) and createAirtableFileRecord(access_airtable_create_dict):
@@ -238,10 +261,23 @@ def createAccessFile(filePath, airtable_create_dict, reason_list):
     return accessFilePath
     #ffmpeg -i input.mp4 -filter_complex "[0:a]showwaves=s=1280x720,format=yuv420p[vid]" -map "[vid]" -map 0:a -codec:v libx264 -crf 18 -preset fast -codec:a aac -strict -2 -b:a 192k output.mp4
 
-def getMediaInfo(filePath):
-    cmd = [ config.MEDIAINFO_PATH, '-f', '--Output=XML', filePath ]
-    media_info = subprocess.Popen( cmd, stdout=subprocess.PIPE ).communicate()[0]
-    return media_info
+def classifyAlbum(input_album_path):
+    #Returns a list of (file path, "Image", "Audio" or None) for the files in an album folder.
+    #Images and audio are recognised from their first few KB. Anything else is run through mediainfo, in batches
+    album_file_paths = [os.path.join(input_album_path,f) for f in sorted(os.listdir(input_album_path)) if not f.startswith('.')]
+    album_types = {}
+    for album_file_path in album_file_paths:
+        album_types[album_file_path] = sniffFileType(album_file_path) if getattr(config, 'MEDIAINFO_SNIFF', True) else None
+    unknown_file_paths = [album_file_path for album_file_path in album_file_paths if album_types[album_file_path] not in ("Image", "Audio")]
+    album_tracks = probeFiles(unknown_file_paths)
+    for album_file_path in unknown_file_paths:
+        if hasTrack(album_tracks[album_file_path], "Image"):
+            album_types[album_file_path] = "Image"
+        elif hasTrack(album_tracks[album_file_path], "Audio"):
+            album_types[album_file_path] = "Audio"
+        else:
+            album_types[album_file_path] = None
+    return [(album_file_path, album_types[album_file_path]) for album_file_path in album_file_paths]
 
 def verifyAlbum(record_dict, input_album_path, args):
     #Verifies that the image files in the folder conform to proper specifications
@@ -251,17 +287,15 @@ def verifyAlbum(record_dict, input_album_path, args):
     file_list = []
     album_type = None
 
-    for f in os.listdir(input_album_path):
-        if not f.startswith('.'):
-            pres_mediainfo_text = getMediaInfo(os.path.join(input_album_path,f))
-            if "track type=\"Image\"" in pres_mediainfo_text.decode():
-                file_list.append(os.path.join(input_album_path,f))
-                album_type = "Image"
-            elif "track type=\"Audio\"" in pres_mediainfo_text.decode():
-                file_list.append(os.path.join(input_album_path,f))
-                album_type = "Audio"
-            else:
-                album_type = None
+    for album_file_path, album_file_type in classifyAlbum(input_album_path):
+        if album_file_type == "Image":
+            file_list.append(album_file_path)
+            album_type = "Image"
+        elif album_file_type == "Audio":
+            file_list.append(album_file_path)
+            album_type = "Audio"
+        else:
+            album_type = None
 
     #This sections makes sure that there are no single or double quotes in the file name
 
@@ -273,11 +307,9 @@ def verifyAlbum(record_dict, input_album_path, args):
         print("\n")
         if userInput == "skip":
             return None
-        for f in os.listdir(input_album_path):
-            if not f.startswith('.'):
-                pres_mediainfo_text = getMediaInfo(os.path.join(input_album_path,f))
-                if "track type=\"Image\"" in pres_mediainfo_text.decode():
-                    file_list.append(os.path.join(input_album_path,f))
+        for album_file_path, album_file_type in classifyAlbum(input_album_path):
+            if album_file_type == "Image":
+                file_list.append(album_file_path)
 
 
 
@@ -289,11 +321,9 @@ def verifyAlbum(record_dict, input_album_path, args):
         if userInput == "skip":
             return None
         file_list = []
-        for f in os.listdir(input_album_path):
-            if not f.startswith('.'):
-                pres_mediainfo_text = getMediaInfo(os.path.join(input_album_path,f))
-                if "track type=\"Image\"" in pres_mediainfo_text.decode():
-                    file_list.append(os.path.join(input_album_path,f))
+        for album_file_path, album_file_type in classifyAlbum(input_album_path):
+            if album_file_type == "Image":
+                file_list.append(album_file_path)
 
     while any("\"" in s for s in file_list):
         bad_char = True
@@ -303,11 +333,9 @@ def verifyAlbum(record_dict, input_album_path, args):
         if userInput == "skip":
             return None
         file_list = []
-        for f in os.listdir(input_album_path):
-            if not f.startswith('.'):
-                pres_mediainfo_text = getMediaInfo(os.path.join(input_album_path,f))
-                if "track type=\"Image\"" in pres_mediainfo_text.decode():
-                    file_list.append(os.path.join(input_album_path,f))
+        for album_file_path, album_file_type in classifyAlbum(input_album_path):
+            if album_file_type == "Image":
+                file_list.append(album_file_path)
 
     while any("`" in s for s in file_list):
         bad_char = True
@@ -317,11 +345,9 @@ def verifyAlbum(record_dict, input_album_path, args):
         if userInput == "skip":
             return None
         file_list = []
-        for f in os.listdir(input_album_path):
-            if not f.startswith('.'):
-                pres_mediainfo_text = getMediaInfo(os.path.join(input_album_path,f))
-                if "track type=\"Image\"" in pres_mediainfo_text.decode():
-                    file_list.append(os.path.join(input_album_path,f))
+        for album_file_path, album_file_type in classifyAlbum(input_album_path):
+            if album_file_type == "Image":
+                file_list.append(album_file_path)
 
     #If there are images in the folder we need to create preview thumbnails
     if album_type == "Image":
@@ -585,14 +611,42 @@ def createVideoPreview(input_path):
 #    mogrify_output = subprocess.Popen( cmd, stdout=subprocess.PIPE ).communicate()[0]
 
 def updateAirtableField(record_id, update_dict, RID, Table):
-    airtable = Airtable(config.BASE_ID, Table, config.API_KEY)
     try:
-        airtable.update(record_id, update_dict)
+        updateAirtableRecord(Table, record_id, update_dict)
         logging.info('Succesfully updated field in table %s \'%s\' for record %s ' % (Table, str(list(update_dict.keys())[0]), RID))
     except Exception as e:
         logging.error('Could not updated field in table %s \'%s\' for record %s ' % (Table, str(list(update_dict.keys())[0]), RID))
         logging.error('%s' % e)
 
+def ingestFromStaging(record_dict, staging_path, ingest_digests):
+    #Copies a record's file from the staging folder into its record folder, computing the checksums on the way through.
+    #Staged records live in a folder named after the record number, just like on the drive. Albums are copied as they are,
+    #since they don't get checksums. The staging folder is left untouched. Adds the checksums of each copied file to ingest_digests
+    source_path = os.path.join(staging_path, record_dict['RID'])
+    record_path = os.path.join('/Volumes', config.DRIVE_NAME, record_dict['RID'])
+    if not os.path.isdir(source_path):
+        logging.warning('No folder named %s found in staging folder %s. Nothing will be copied for this record' % (record_dict['RID'], staging_path))
+        return False
+    for file_name in os.listdir(source_path):
+        if file_name.startswith('.'):
+            continue
+        source_file_path = os.path.join(source_path, file_name)
+        dest_file_path = os.path.join(record_path, file_name)
+        if os.path.exists(dest_file_path):
+            logging.warning('%s is already in record folder %s, it will not be copied from staging' % (file_name, record_dict['RID']))
+            continue
+        try:
+            if os.path.isdir(source_file_path):
+                logging.info('Copying album %s from staging into record folder %s' % (file_name, record_dict['RID']))
+                shutil.copytree(source_file_path, dest_file_path)
+            else:
+                logging.info('Copying %s from staging into record folder %s and computing checksums during the copy' % (file_name, record_dict['RID']))
+                ingest_digests[dest_file_path] = copyFileWithHashes(source_file_path, dest_file_path)
+        except Exception as e:
+            logging.error('Could not copy %s from staging into record folder %s: %s' % (file_name, record_dict['RID'], e))
+            return False
+    return True
+
 def createRecordFolder(record_number,args):
     #Creates a folder on the drive for the record being processed
     logging.info('Creating folder for record: %s.' % record_number)
@@ -627,7 +681,8 @@ def findRecordToAdd():
     drive_name = config.DRIVE_NAME
     logging.info('Looking for new records to add to drive named: %s.' % drive_name)
     record_dict_list = []
-    pages = getAirtablePages("Records")
+    #only ask Airtable for records flagged for intake, and only the fields we need from them
+    pages = getAirtablePages("Records", fields=[config.RECORD_NUMBER, config.FILE_PROCESS_STATUS], formula=formulaEquals(config.FILE_PROCESS_STATUS, config.FILE_INTAKE_FLAG))
     for page in pages:
         for record in page:
             RID = record['fields'][config.RECORD_NUMBER]
@@ -644,21 +699,6 @@ def findRecordToAdd():
     return record_dict_list_sorted
 
 
-def generateHash(inputFile, blocksize=65536):
-    '''
-    using a buffer, hash the file
-    '''
-    md5 = hashlib.md5()
-
-    with open(inputFile, 'rb') as f:
-        while True:
-            data = f.read(blocksize)
-            if not data:
-                break
-            md5.update(data)
-
-    return md5.hexdigest()
-
 def driveAudit():
     #This performs a quick drive audit, checking to see if drive contains every record labeled as "in library" in airtable
     #TODO -> harvest "on drive" info from related file record for more accurate maintenance
@@ -767,14 +807,7 @@ def findRecord(UID, drive_name):
             #print('%s' % (str(file)))                                   #commented out standard output
             logging.error('%s' % (str(file)))
 
-def getAirtablePages(table_name):
-    #takes table name, returns pages.
-    #BASE_ID and API_KEY come from config.py file.
-    airtable = Airtable(config.BASE_ID, table_name, config.API_KEY)
-    pages = airtable.get_iter()
-    return pages
-
-def parseMediaInfo(filePath, media_info_text, RID, parent_id):
+def parseMediaInfo(filePath, tracks, RID, parent_id):
     # The following line initializes the dict.
     parent_id_array = [parent_id]   #for some reason airatble needs this as an array.
     airtable_create_dict = {config.PARENT_ID : parent_id_array, config.FULL_FILE_NAME : "", config.FILENAME : "", config.DURATION : "", config.FILE_SIZE_STRING : "", config.FILE_SIZE : "", config.FILE_FORMAT : "", config.VIDEO_CODEC : "", config.VIDEO_BIT_DEPTH : "", config.VIDEO_SCAN_TYPE : "", config.VIDEO_FRAME_RATE : "", config.VIDEO_FRAME_SIZE : "", config.VIDEO_ASPECT_RATIO : "",  config.AUDIO_SAMPLING_RATE : "", config.AUDIO_CODEC : "", config.COPY_VERSION : ""}
@@ -782,34 +815,15 @@ def parseMediaInfo(filePath, media_info_text, RID, parent_id):
     airtable_create_dict[config.FULL_FILE_NAME] = fileNameTemp
     fileNameExtension = fileNameTemp.split(".")[-1]
     airtable_create_dict[config.FILENAME] = fileNameTemp.split("." + fileNameExtension)[0]
-    media_info_text = media_info_text.decode()
     logging.info("Parsing mediainfo for file: %s" % airtable_create_dict[config.FILENAME])
     file_type = None
-    file_has_general = False
-    file_has_video = False
-    file_has_image = False
-    file_has_audio = False
+    file_has_general = hasTrack(tracks, "General")
+    file_has_video = hasTrack(tracks, "Video")
+    file_has_image = hasTrack(tracks, "Image")
+    file_has_audio = hasTrack(tracks, "Audio")
 
-    try:
-        mi_General_Text = (media_info_text.split("<track type=\"General\">"))[1].split("</track>")[0]
-        file_has_general = True
-    except:
+    if not file_has_general:
         logging.error('The file %s is not a properly formed media file. Please check that this file is correct' %  airtable_create_dict[config.FILENAME])
-    try:
-        mi_Video_Text = (media_info_text.split("<track type=\"Video\">"))[1].split("</track>")[0]
-        file_has_video = True
-    except:
-        file_has_video = False
-    try:
-        mi_Audio_Text = (media_info_text.split("<track type=\"Audio\">"))[1].split("</track>")[0]
-        file_has_audio = True
-    except:
-        file_has_audio = False
-    try:
-        mi_Image_Text = (media_info_text.split("<track type=\"Image\">"))[1].split("</track>")[0]
-        file_has_image = True
-    except:
-        file_has_image = False
 
     if file_has_image: #Process as image file
         logging.info('Image file detected. The file %s will be processed as an image only file' %  airtable_create_dict[config.FILENAME])
@@ -846,89 +860,70 @@ def parseMediaInfo(filePath, media_info_text, RID, parent_id):
     # General Stuff
 
     if file_type != "Image":
-        try:
-            airtable_create_dict[config.DURATION] = (mi_General_Text.split("<Duration_String3>"))[1].split("</Duration_String3>")[0]
-        except:
+        airtable_create_dict[config.DURATION] = getFieldValue(tracks, 'DURATION')
+        if airtable_create_dict[config.DURATION] is None:
             logging.error("MEDIAINFO ERROR: Could not parse Duration for " + airtable_create_dict[config.FILENAME])
             airtable_create_dict[config.DURATION] = "Error"
-    try:
-        airtable_create_dict[config.FILE_FORMAT] = (mi_General_Text.split("<Format_String>"))[1].split("</Format_String>")[0]
-    except:
+    if getFieldValue(tracks, 'FILE_FORMAT') is not None:
+        airtable_create_dict[config.FILE_FORMAT] = getFieldValue(tracks, 'FILE_FORMAT')
+    else:
         logging.error("MEDIAINFO ERROR: Could not File Format for " + airtable_create_dict[config.FILENAME])
-    try:
-        airtable_create_dict[config.FILE_SIZE_STRING] = (mi_General_Text.split("<FileSize_String4>"))[1].split("</FileSize_String4>")[0]
-    except:
+    if getFieldValue(tracks, 'FILE_SIZE_STRING') is not None:
+        airtable_create_dict[config.FILE_SIZE_STRING] = getFieldValue(tracks, 'FILE_SIZE_STRING')
+    else:
         logging.error("MEDIAINFO ERROR: Could not parse File Size for " + airtable_create_dict[config.FILENAME])
     try:
-        airtable_create_dict[config.FILE_SIZE] = int((mi_General_Text.split("<FileSize>"))[1].split("</FileSize>")[0])
-    except:
+        airtable_create_dict[config.FILE_SIZE] = int(getFieldValue(tracks, 'FILE_SIZE'))
+    except (TypeError, ValueError):
         logging.error("MEDIAINFO ERROR: Could not parse File Size for " + airtable_create_dict[config.FILENAME])
 
     # Video Stuff
 
     if file_type == "Video" or file_type == "Silent_Video":
-        try:
-            airtable_create_dict[config.VIDEO_CODEC] = (mi_Video_Text.split("<CodecID>"))[1].split("</CodecID>")[0]
-        except:
-            try:
-                airtable_create_dict[config.VIDEO_CODEC] = (mi_Video_Text.split("<Format>"))[1].split("</Format>")[0]
-            except:
-                logging.error("MEDIAINFO ERROR: Could not parse Video Track Encoding for " + airtable_create_dict[config.FILENAME])
-        try:
-            airtable_create_dict[config.VIDEO_BIT_DEPTH] = (mi_Video_Text.split("<BitDepth>"))[1].split("</BitDepth>")[0]
-        except:
+        if getFieldValue(tracks, 'VIDEO_CODEC') is not None:
+            airtable_create_dict[config.VIDEO_CODEC] = getFieldValue(tracks, 'VIDEO_CODEC')
+        else:
+            logging.error("MEDIAINFO ERROR: Could not parse Video Track Encoding for " + airtable_create_dict[config.FILENAME])
+        if getFieldValue(tracks, 'VIDEO_BIT_DEPTH') is not None:
+            airtable_create_dict[config.VIDEO_BIT_DEPTH] = getFieldValue(tracks, 'VIDEO_BIT_DEPTH')
+        else:
             logging.error("MEDIAINFO ERROR: Could not parse Video Bit Depth for " + airtable_create_dict[config.FILENAME])
             airtable_create_dict[config.VIDEO_BIT_DEPTH] = "None"
-        try:
-            airtable_create_dict[config.VIDEO_SCAN_TYPE] = (mi_Video_Text.split("<ScanType_String>"))[1].split("</ScanType_String>")[0]
-        except:
+        if getFieldValue(tracks, 'VIDEO_SCAN_TYPE') is not None:
+            airtable_create_dict[config.VIDEO_SCAN_TYPE] = getFieldValue(tracks, 'VIDEO_SCAN_TYPE')
+        else:
             logging.error("MEDIAINFO ERROR: Could not parse Scan Type for " + airtable_create_dict[config.FILENAME])
-        try:
-            airtable_create_dict[config.VIDEO_FRAME_RATE] = (mi_Video_Text.split("<FrameRate>"))[1].split("</FrameRate>")[0]
+        if getFieldValue(tracks, 'VIDEO_FRAME_RATE') is not None:
+            airtable_create_dict[config.VIDEO_FRAME_RATE] = getFieldValue(tracks, 'VIDEO_FRAME_RATE')
             airtable_create_dict[config.VIDEO_BIT_DEPTH] = "None"
-        except:
+        else:
             logging.error("MEDIAINFO ERROR: Could not parse Frame Rate for " + airtable_create_dict[config.FILENAME])
-        try:
-            frame_width = (mi_Video_Text.split("<Width>"))[1].split("</Width>")[0]
-        except:
-            logging.error("MEDIAINFO ERROR: Could not parse Frame Width for " + airtable_create_dict[config.FILENAME])
-        try:
-            frame_height = (mi_Video_Text.split("<Height>"))[1].split("</Height>")[0]
-        except:
-            logging.error("MEDIAINFO ERROR: Could not parse Frame Height for " + airtable_create_dict[config.FILENAME])
-
-        airtable_create_dict[config.VIDEO_FRAME_SIZE] = frame_width + "x" + frame_height
-
-        try:
-            airtable_create_dict[config.VIDEO_ASPECT_RATIO] = (mi_Video_Text.split("<DisplayAspectRatio_String>"))[1].split("</DisplayAspectRatio_String>")[0]
-        except:
+        if getFrameSize(tracks, "Video") is not None:
+            airtable_create_dict[config.VIDEO_FRAME_SIZE] = getFrameSize(tracks, "Video")
+        else:
+            logging.error("MEDIAINFO ERROR: Could not parse Frame Size for " + airtable_create_dict[config.FILENAME])
+        if getFieldValue(tracks, 'VIDEO_ASPECT_RATIO') is not None:
+            airtable_create_dict[config.VIDEO_ASPECT_RATIO] = getFieldValue(tracks, 'VIDEO_ASPECT_RATIO')
+        else:
             print("MEDIAINFO ERROR: Could not parse Display Aspect Ratio for " + airtable_create_dict[config.FILENAME])
 
     # Audio Stuff
     if file_type == "Video" or file_type == "Audio":
-        try:
-            airtable_create_dict[config.AUDIO_SAMPLING_RATE] = (mi_Audio_Text.split("<SamplingRate>"))[1].split("</SamplingRate>")[0]
-        except:
+        if getFieldValue(tracks, 'AUDIO_SAMPLING_RATE') is not None:
+            airtable_create_dict[config.AUDIO_SAMPLING_RATE] = getFieldValue(tracks, 'AUDIO_SAMPLING_RATE')
+        else:
             logging.error("MEDIAINFO ERROR: Could not parse Audio Sampling Rate for " + airtable_create_dict[config.FILENAME])
-        try:
-            airtable_create_dict[config.AUDIO_CODEC] = (mi_Audio_Text.split("<Codec>"))[1].split("</Codec>")[0]
-        except:
-            try:
-                airtable_create_dict[config.AUDIO_CODEC] = (mi_Audio_Text.split("<Format>"))[1].split("</Format>")[0]
-            except:
-                logging.error("MEDIAINFO ERROR: Could not parse Audio Track Encoding for " + airtable_create_dict[config.FILENAME])
+        if getFieldValue(tracks, 'AUDIO_CODEC') is not None:
+            airtable_create_dict[config.AUDIO_CODEC] = getFieldValue(tracks, 'AUDIO_CODEC')
+        else:
+            logging.error("MEDIAINFO ERROR: Could not parse Audio Track Encoding for " + airtable_create_dict[config.FILENAME])
 
     #Image Stuff
     if file_type == "Image":
-        try:
-            frame_width = (mi_Image_Text.split("<Width>"))[1].split("</Width>")[0]
-        except:
-            logging.error("MEDIAINFO ERROR: Could not parse Image Width for " + airtable_create_dict[config.FILENAME])
-        try:
-            frame_height = (mi_Image_Text.split("<Height>"))[1].split("</Height>")[0]
-        except:
-            logging.error("MEDIAINFO ERROR: Could not parse Image Height for " + airtable_create_dict[config.FILENAME])
-        airtable_create_dict[config.VIDEO_FRAME_SIZE] = frame_width + "x" + frame_height
+        if getFrameSize(tracks, "Image") is not None:
+            airtable_create_dict[config.VIDEO_FRAME_SIZE] = getFrameSize(tracks, "Image")
+        else:
+            logging.error("MEDIAINFO ERROR: Could not parse Image Size for " + airtable_create_dict[config.FILENAME])
 
     #No longer harvesting checksum during this process, doing so after the records are updated
     #try:
@@ -940,7 +935,7 @@ def parseMediaInfo(filePath, media_info_text, RID, parent_id):
 
 def createAirtableFileRecord(pres_airtable_create_dict):
     try:
-        airtable = Airtable(config.BASE_ID, "Files", config.API_KEY)
+        airtable = getAirtableTable("Files")
         return airtable.insert(pres_airtable_create_dict)
     except Exception as e:
         logging.error("Could not create an airtable file entry for file/album %s " % (pres_airtable_create_dict[config.FILENAME]))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+# Local SQLite mirror of the Records and Files tables.
+# The mirror is refreshed from Airtable with the --Sync-Mirror flag, and the maintenance scripts can read from it
+# instead of Airtable with the --Offline flag. Each row keeps the whole Airtable record as JSON, and the fields we
+# search on are copied into their own indexed columns.
+
+import os
+import json
+import sqlite3
+import config
+from datetime import datetime, timezone
+
+
+#Columns we copy out of each record so we can search on them. Column name -> config field name
+RECORDS_COLUMNS = {'record_number' : 'RECORD_NUMBER', 'status' : 'RECORD_STATUS', 'online_platform' : 'ACCESS_PLATFORM', 'file_process_status' : 'FILE_PROCESS_STATUS'}
+FILES_COLUMNS = {'record_number' : 'RECORD_NUMBER_LOOKUP', 'status' : 'RECORD_STATUS_LOOKUP', 'part_of_record' : 'PARENT_ID', 'checksum' : 'CHECKSUM', 'file_format' : 'FILE_FORMAT'}
+MIRROR_TABLES = {'Records' : ('records', RECORDS_COLUMNS), 'Files' : ('files', FILES_COLUMNS)}
+MIRROR_PAGE_SIZE = 100
+
+mirror_connection = None
+
+
+def getCacheDir():
+    #The folder where the local copies of Airtable are kept
+    return getattr(config, 'AIRTABLE_CACHE_PATH', '') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'airtable_cache')
+
+def openMirror():
+    #Opens the mirror database (creating it if needed) and returns the connection
+    global mirror_connection
+    if mirror_connection is None:
+        os.makedirs(getCacheDir(), exist_ok=True)
+        mirror_connection = sqlite3.connect(os.path.join(getCacheDir(), 'airtable_mirror.db'))
+        createMirrorTables(mirror_connection)
+    return mirror_connection
+
+def createMirrorTables(connection):
+    for table_name, (sql_table, columns) in MIRROR_TABLES.items():
+        column_sql = ''.join([', %s TEXT' % column for column in columns])
+        connection.execute('CREATE TABLE IF NOT EXISTS %s (id TEXT PRIMARY KEY%s, record TEXT)' % (sql_table, column_sql))
+        for column in columns:
+            connection.execute('CREATE INDEX IF NOT EXISTS %s_%s ON %s (%s)' % (sql_table, column, sql_table, column))
+    connection.execute('CREATE TABLE IF NOT EXISTS mirror_info (table_name TEXT PRIMARY KEY, synced TEXT, record_count INTEGER)')
+    connection.commit()
+
+def getColumnValue(record, field_name):
+    #Lookup and linked record fields come back from Airtable as lists. We index the first value, which is all these scripts ever use
+    value = record['fields'].get(field_name)
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return value
+
+def recordToRow(record, columns):
+    return [record['id']] + [getColumnValue(record, getattr(config, field_name)) for field_name in columns.values()] + [json.dumps(record)]
+
+def syncMirror(table_name, pages):
+    #Replaces the mirror of a table with the given Airtable pages, in a single transaction
+    connection = openMirror()
+    sql_table, columns = MIRROR_TABLES[table_name]
+    rows = [recordToRow(record, columns) for page in pages for record in page]
+    placeholders = ', '.join(['?'] * (len(columns) + 2))
+    with connection:
+        connection.execute('DELETE FROM %s' % sql_table)
+        connection.executemany('INSERT INTO %s VALUES (%s)' % (sql_table, placeholders), rows)
+        connection.execute('INSERT OR REPLACE INTO mirror_info VALUES (?, ?, ?)', (table_name, datetime.now(timezone.utc).isoformat(), len(rows)))
+    return len(rows)
+
+def getMirrorInfo(table_name):
+    #Returns (synced time, record count) for a mirrored table, or None if it has never been synced
+    row = openMirror().execute('SELECT synced, record_count FROM mirror_info WHERE table_name = ?', (table_name,)).fetchone()
+    return row
+
+def queryMirror(table_name, where=None, params=()):
+    #Returns matching records from the mirror, in the same list of pages format as Airtable.
+    #where is a SQL condition on the indexed columns, for example "status = ?"
+    sql_table = MIRROR_TABLES[table_name][0]
+    sql = 'SELECT record FROM %s' % sql_table
+    if where:
+        sql += ' WHERE ' + where
+    record_list = [json.loads(row[0]) for row in openMirror().execute(sql, params)]
+    return [record_list[i:i + MIRROR_PAGE_SIZE] for i in range(0, len(record_list), MIRROR_PAGE_SIZE)]
+
+def updateMirrorRecord(table_name, record_id, update_dict):
+    #Applies an update we just sent to Airtable to the mirror, so the mirror doesn't go stale between syncs
+    connection = openMirror()
+    sql_table, columns = MIRROR_TABLES[table_name]
+    row = connection.execute('SELECT record FROM %s WHERE id = ?' % sql_table, (record_id,)).fetchone()
+    if row is None:
+        return
+    record = json.loads(row[0])
+    record['fields'].update(update_dict)
+    for field_name in [field_name for field_name, value in update_dict.items() if value is None or value == '']:
+        del record['fields'][field_name]      #Airtable leaves cleared fields out of a record, so the mirror does too
+    with connection:
+        connection.execute('DELETE FROM %s WHERE id = ?' % sql_table, (record_id,))
+        connection.execute('INSERT INTO %s VALUES (%s)' % (sql_table, ', '.join(['?'] * (len(columns) + 2))), recordToRow(record, columns))
+
+def deleteMirrorRecord(table_name, record_id):
+    sql_table = MIRROR_TABLES[table_name][0]
+    with openMirror() as connection:
+        connection.execute('DELETE FROM %s WHERE id = ?' % sql_table, (record_id,))
@@ -0,0 +1,562 @@
+#!/usr/bin/env python3
+
+# Shared Airtable helpers used by addRecord.py, recordMaintenance.py and accessMaintenance.py
+
+import logging          # This loads the "logging" module, which handles logging very simply
+import os
+import json             # Needed for the on-disk Airtable cache
+import time
+import random
+import threading        # Needed to keep downloading Airtable pages while the caller works on the ones it already has
+import queue
+import asyncio          # Needed to keep several Airtable requests in flight at once
+import atexit           # Needed to flush queued Airtable updates when the script quits
+import config
+from datetime import datetime, timedelta, timezone
+import requests         # Needed for the shared, pooled HTTP session. This is installed alongside the airtable module
+from requests.adapters import HTTPAdapter
+from airtable import Airtable
+import airtableMirror   # Local SQLite copy of the Records and Files tables, used in offline mode
+
+
+#The snapshot holds every page of every table we've read during this run, keyed by table name.
+#Each table is only downloaded once per run, every audit and subprocess after that gets the same in-memory pages
+airtable_snapshot = {}
+snapshot_stats = {'pages_fetched' : 0, 'pages_saved' : 0, 'records_fetched' : 0}
+
+#In offline mode every read comes from the local SQLite mirror instead of Airtable. Writes still go to Airtable
+offline_mode = False
+
+#Airtable sends records 100 at a time. Cached tables are handed back in pages of the same size
+AIRTABLE_PAGE_SIZE = 100
+SYNC_CURSOR_MARGIN_MINUTES = 5
+
+#Tables we deleted records from this run. The incremental sync can't see deletions (or the lookup fields they change),
+#so once the snapshot of one of these tables is cleared the next read downloads the whole table again
+deleted_tables = set()
+
+#Every Airtable client shares one keep-alive HTTP session, so we only pay for the TLS handshake once per connection
+#instead of once per request. There's one client per table, cached for the whole run.
+AIRTABLE_POOL_SIZE = 10
+airtable_session = None
+airtable_tables = {}
+
+#Airtable accepts up to 10 records per update request and 5 requests per second per base
+AIRTABLE_BATCH_SIZE = 10
+AIRTABLE_REQUESTS_PER_SECOND = 5
+
+#Write requests go through an asyncio runner. It keeps a few requests in flight at once, stays under the
+#requests per second budget with a token bucket, and retries rate limit (429) and server (5xx) errors with a jittered backoff
+AIRTABLE_MAX_IN_FLIGHT = 4
+AIRTABLE_MAX_RETRIES = 6
+AIRTABLE_RETRY_STATUS = [429, 500, 502, 503, 504]
+AIRTABLE_BACKOFF_BASE = 1.0
+AIRTABLE_BACKOFF_MAX = 30.0     #Airtable asks clients to wait 30 seconds after a 429
+token_bucket = {'tokens' : AIRTABLE_REQUESTS_PER_SECOND, 'updated' : 0.0}
+retry_stats = {'retries' : 0}
+
+#How many record ids we put into a single RECORD_ID() lookup formula. Keeps the request URL a sensible length
+RECORD_ID_CHUNK_SIZE = 50
+
+#The update queue holds pending updates per table until there are enough to fill a batch
+update_queue = {}
+
+
+def getAirtableSession():
+    #Returns the shared HTTP session, creating it the first time it's needed
+    global airtable_session
+    if airtable_session is None:
+        airtable_session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=AIRTABLE_POOL_SIZE, pool_maxsize=AIRTABLE_POOL_SIZE)
+        airtable_session.mount('https://', adapter)
+        airtable_session.mount('http://', adapter)
+    return airtable_session
+
+def getAirtableTable(table_name):
+    #Returns the Airtable client for a table. BASE_ID and API_KEY come from config.py file.
+    #Use this instead of Airtable(config.BASE_ID, table_name, config.API_KEY) so every call reuses the same connections
+    if table_name not in airtable_tables:
+        airtable = Airtable(config.BASE_ID, table_name, config.API_KEY)
+        session = getAirtableSession()
+        session.auth = airtable.session.auth     #the airtable module sets up authentication on its own session, we borrow it
+        airtable.session = session
+        airtable_tables[table_name] = airtable
+    return airtable_tables[table_name]
+
+def getConnectionStats():
+    #Returns how many requests went through the shared session and how many new connections had to be opened for them
+    connection_stats = {'requests' : 0, 'connections' : 0, 'reused' : 0}
+    if airtable_session is None:
+        return connection_stats
+    for adapter in set(airtable_session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for pool_key in pools.keys():
+            pool = pools[pool_key]
+            connection_stats['requests'] += pool.num_requests
+            connection_stats['connections'] += pool.num_connections
+    connection_stats['reused'] = connection_stats['requests'] - connection_stats['connections']
+    return connection_stats
+
+def getAirtablePages(table_name, fields=None, formula=None, mirror_where=None, mirror_params=()):
+    #takes table name, returns pages.
+    #BASE_ID and API_KEY come from config.py file.
+    #fields is an optional list of field names to download, formula is an optional filterByFormula expression.
+    #Use them whenever a subprocess only needs some of the rows or columns, so Airtable does the filtering for us.
+    #mirror_where and mirror_params are the same filter written as SQL on the mirror's indexed columns, used in offline mode.
+    #Without them offline reads return the whole table, so callers should still check the records they get back.
+    #The first call for a table (with the same fields and formula) downloads it, every call after that returns the cached snapshot
+    snapshot_key = (table_name, tuple(fields) if fields else None, formula)
+    if snapshot_key in airtable_snapshot:
+        pages = airtable_snapshot[snapshot_key]
+        snapshot_stats['pages_saved'] += len(pages)
+        logging.debug('Using Airtable snapshot for table %s (%i page(s))' % (table_name, len(pages)))
+        return pages
+
+    if offline_mode:
+        pages = airtableMirror.queryMirror(table_name, mirror_where, mirror_params)
+    elif fields is None and formula is None and getattr(config, 'AIRTABLE_INCREMENTAL_SYNC', False):
+        pages = syncAirtableTable(table_name)     #whole table requests can be served from the on-disk cache plus recent changes
+    else:
+        pages = downloadAirtablePages(table_name, fields, formula)
+    airtable_snapshot[snapshot_key] = pages
+    return pages
+
+def iterAirtablePages(table_name, fields=None, formula=None):
+    #Same as getAirtablePages, but hands back each page as soon as it arrives instead of waiting for the whole table.
+    #The download carries on in a background thread, so the caller can work on the first pages (like hashing files)
+    #while the rest are still on their way. Once the download finishes the pages are saved to the snapshot as usual.
+    #Pages are streamed whenever something has to be downloaded: a plain download, or a whole table request with
+    #AIRTABLE_INCREMENTAL_SYNC on (a full refresh streams page by page, an incremental sync streams the cached table once
+    #the changes are in). A table that's already in the snapshot (say from the audits) or in offline mode is already local,
+    #so its pages are just handed back
+    snapshot_key = (table_name, tuple(fields) if fields else None, formula)
+    if snapshot_key in airtable_snapshot or offline_mode:
+        for page in getAirtablePages(table_name, fields, formula):     #already local, nothing to overlap
+            yield page
+        return
+
+    if fields is None and formula is None and getattr(config, 'AIRTABLE_INCREMENTAL_SYNC', False):
+        page_source = iterSyncAirtableTable(table_name)
+    else:
+        page_source = iterDownloadAirtablePages(table_name, fields, formula)
+    page_queue = queue.Queue()
+    def downloadPages():
+        try:
+            for page in page_source:
+                page_queue.put(page)
+            page_queue.put(None)        #None tells the caller the download is finished
+        except Exception as e:
+            page_queue.put(e)
+    download_thread = threading.Thread(target=downloadPages, daemon=True)
+    download_thread.start()
+
+    pages = []
+    while True:
+        page = page_queue.get()
+        if page is None:
+            break
+        if isinstance(page, Exception):
+            raise page
+        pages.append(page)
+        yield page
+    airtable_snapshot[snapshot_key] = pages
+
+def setOfflineMode(enabled):
+    #Turns offline mode on or off. Returns False if offline mode was asked for but the mirror has never been synced
+    global offline_mode
+    if enabled:
+        for table_name in airtableMirror.MIRROR_TABLES:
+            mirror_info = airtableMirror.getMirrorInfo(table_name)
+            if mirror_info is None:
+                logging.error('The local mirror of table %s has never been synced. Please run with --Sync-Mirror first' % table_name)
+                return False
+            logging.info('Reading table %s from the local mirror, last synced %s (%i records)' % (table_name, mirror_info[0], mirror_info[1]))
+    offline_mode = enabled
+    clearAirtableSnapshot()
+    return True
+
+def syncAirtableMirror():
+    #Refreshes the local SQLite mirror of the Records and Files tables from Airtable
+    for table_name in airtableMirror.MIRROR_TABLES:
+        clearAirtableSnapshot(table_name)
+        pages = getAirtablePages(table_name)
+        record_count = airtableMirror.syncMirror(table_name, pages)
+        logging.info('Synced local mirror of table %s, %i records' % (table_name, record_count))
+        print('Synced local mirror of table %s, %i records' % (table_name, record_count))
+
+def iterDownloadAirtablePages(table_name, fields=None, formula=None):
+    #Downloads every page of a table from Airtable, optionally only some fields and/or records, yielding each page as it arrives
+    options = {}
+    if fields:
+        options['fields'] = list(fields)
+    if formula:
+        options['formula'] = formula
+    airtable = getAirtableTable(table_name)
+    page_count = 0
+    for page in airtable.get_iter(**options):
+        snapshot_stats['pages_fetched'] += 1
+        snapshot_stats['records_fetched'] += len(page)
+        page_count += 1
+        yield page
+    logging.debug('Downloaded Airtable snapshot for table %s (%i page(s), formula: %s)' % (table_name, page_count, formula))
+
+def downloadAirtablePages(table_name, fields=None, formula=None):
+    #Downloads every page of a table from Airtable, optionally only some fields and/or records
+    return list(iterDownloadAirtablePages(table_name, fields, formula))
+
+def getSyncCachePath(table_name):
+    return os.path.join(airtableMirror.getCacheDir(), table_name + '.json')
+
+def loadSyncCache(table_name):
+    #Returns the cached copy of a table from the last run, or None if there isn't a usable one
+    cache_path = getSyncCachePath(table_name)
+    if not os.path.isfile(cache_path):
+        return None
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logging.warning('Could not read Airtable cache for table %s, doing a full download instead: %s' % (table_name, e))
+        return None
+
+def saveSyncCache(table_name, sync_cache):
+    #Writes the cache to a temp file first so an interrupted run can't leave a half written cache behind
+    cache_path = getSyncCachePath(table_name)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    temp_path = cache_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(sync_cache, f)
+    os.replace(temp_path, cache_path)
+
+def syncAirtableTable(table_name):
+    #Brings the on-disk copy of a table up to date and returns it as pages, see iterSyncAirtableTable
+    return list(iterSyncAirtableTable(table_name))
+
+def iterSyncAirtableTable(table_name):
+    #Brings the on-disk copy of a table up to date, yielding it page by page.
+    #Normally we only ask Airtable for records modified since the last sync (the sync cursor), and the cached table is
+    #yielded once those changes are in. Deleted records can't be seen that way, and neither can changes to lookup fields
+    #(like the record status on a file), so every AIRTABLE_FULL_REFRESH_DAYS we download the whole table again and start
+    #over. A full refresh yields each page as it arrives. The cache is saved once the last page has been handed on
+    sync_start = datetime.now(timezone.utc)
+    sync_cache = loadSyncCache(table_name)
+    full_refresh_days = getattr(config, 'AIRTABLE_FULL_REFRESH_DAYS', 7)
+
+    full_refresh = True
+    if table_name in deleted_tables:
+        logging.info('Records were deleted from Airtable table %s during this run' % table_name)
+        deleted_tables.discard(table_name)
+    elif sync_cache is not None:
+        last_full_refresh = datetime.fromisoformat(sync_cache['last_full_refresh'])
+        if sync_start - last_full_refresh < timedelta(days=full_refresh_days):
+            full_refresh = False
+
+    if full_refresh:
+        logging.info('Doing a full download of Airtable table %s' % table_name)
+        records = {}
+        for page in iterDownloadAirtablePages(table_name):
+            for record in page:
+                records[record['id']] = record
+            yield page
+        sync_cache = {'last_full_refresh' : sync_start.isoformat()}
+    else:
+        cursor = sync_cache['cursor']
+        modified_formula = "IS_AFTER(LAST_MODIFIED_TIME(), DATETIME_PARSE('%s'))" % cursor
+        records = sync_cache['records']
+        changed_count = 0
+        for page in iterDownloadAirtablePages(table_name, formula=modified_formula):
+            for record in page:
+                records[record['id']] = record
+                changed_count += 1
+        logging.info('Synced Airtable table %s: %i record(s) changed since %s, %i record(s) in cache' % (table_name, changed_count, cursor, len(records)))
+        record_list = list(records.values())
+        for i in range(0, len(record_list), AIRTABLE_PAGE_SIZE):
+            yield record_list[i:i + AIRTABLE_PAGE_SIZE]
+
+    #the cursor is moved back a little so a clock that's slightly off can't make us miss a change
+    sync_cache['cursor'] = (sync_start - timedelta(minutes=SYNC_CURSOR_MARGIN_MINUTES)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    sync_cache['records'] = records
+    try:
+        saveSyncCache(table_name, sync_cache)
+    except Exception as e:
+        logging.warning('Could not save Airtable cache for table %s. The next run will do a full download: %s' % (table_name, e))
+
+def removeFromSyncCache(table_name, record_ids):
+    #Drops deleted records from the on-disk copy of a table, so they can't come back from the cache
+    sync_cache = loadSyncCache(table_name)
+    if sync_cache is None:
+        return
+    for record_id in record_ids:
+        sync_cache['records'].pop(record_id, None)
+    try:
+        saveSyncCache(table_name, sync_cache)
+    except Exception as e:
+        logging.warning('Could not save Airtable cache for table %s: %s' % (table_name, e))
+
+def clearAirtableSnapshot(table_name=None):
+    #Throws away the snapshot of a table (or all tables) so the next read goes back to Airtable.
+    #Call this after a subprocess changes records that a later subprocess needs to see.
+    #If records were deleted from the table this run, the next read is a full download rather than an incremental sync
+    if table_name is None:
+        airtable_snapshot.clear()
+    else:
+        for snapshot_key in list(airtable_snapshot.keys()):
+            if snapshot_key[0] == table_name:
+                del airtable_snapshot[snapshot_key]
+
+def logAirtableStats():
+    #Logs how many pages were downloaded and how many page requests the snapshot saved this run
+    logging.info('Airtable snapshot: %i page(s) (%i record(s)) downloaded, %i page request(s) saved by reusing the snapshot' % (snapshot_stats['pages_fetched'], snapshot_stats['records_fetched'], snapshot_stats['pages_saved']))
+    connection_stats = getConnectionStats()
+    logging.info('Airtable connections: %i request(s) sent over %i connection(s), %i request(s) reused an open connection, %i request(s) retried after rate limit or server errors' % (connection_stats['requests'], connection_stats['connections'], connection_stats['reused'], retry_stats['retries']))
+
+def getAirtableRecordsById(table_name, record_ids=None, fields=None):
+    #Returns a dict of Airtable records keyed by Airtable record id, so lookups don't need one request per record.
+    #If the whole table is already in the snapshot we index that. If a list of record ids is given we ask for
+    #just those records using RECORD_ID() formulas, a chunk at a time. Otherwise we index a bulk scan of the table.
+    full_key = (table_name, None, None)
+    if full_key in airtable_snapshot or offline_mode:
+        pages = getAirtablePages(table_name)
+    elif record_ids is not None:
+        unique_ids = sorted(set(record_ids))
+        pages = []
+        for i in range(0, len(unique_ids), RECORD_ID_CHUNK_SIZE):
+            id_chunk = unique_ids[i:i + RECORD_ID_CHUNK_SIZE]
+            id_formula = formulaOr(*["RECORD_ID() = '%s'" % record_id for record_id in id_chunk])
+            pages.extend(getAirtablePages(table_name, fields=fields, formula=id_formula))
+    else:
+        pages = getAirtablePages(table_name, fields=fields)
+
+    record_index = {}
+    for page in pages:
+        for record in page:
+            record_index[record['id']] = record
+    return record_index
+
+def formulaEquals(field_name, value):
+    #Builds a filterByFormula condition that matches records where a field equals a value
+    return "{%s} = '%s'" % (field_name, str(value).replace("'", "\\'"))
+
+def formulaNotEquals(field_name, value):
+    #Builds a filterByFormula condition that matches records where a field does not equal a value (empty fields match too)
+    return "{%s} != '%s'" % (field_name, str(value).replace("'", "\\'"))
+
+def formulaAnd(*conditions):
+    return "AND(%s)" % ", ".join(conditions)
+
+def formulaOr(*conditions):
+    return "OR(%s)" % ", ".join(conditions)
+
+async def takeToken(bucket_lock):
+    #Waits until the token bucket has a request available. The bucket refills at AIRTABLE_REQUESTS_PER_SECOND
+    async with bucket_lock:
+        while True:
+            now = time.monotonic()
+            refill = (now - token_bucket['updated']) * AIRTABLE_REQUESTS_PER_SECOND
+            token_bucket['tokens'] = min(AIRTABLE_REQUESTS_PER_SECOND, token_bucket['tokens'] + refill)
+            token_bucket['updated'] = now
+            if token_bucket['tokens'] >= 1:
+                token_bucket['tokens'] -= 1
+                return
+            await asyncio.sleep((1 - token_bucket['tokens']) / AIRTABLE_REQUESTS_PER_SECOND)
+
+def isRetryableError(e):
+    #Rate limit errors, server errors and dropped connections are worth retrying. Anything else (like a bad field name) is not
+    if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    response = getattr(e, 'response', None)
+    if response is not None:
+        return response.status_code in AIRTABLE_RETRY_STATUS
+    return False
+
+async def sendAirtableRequest(bucket_lock, in_flight, request_function, request_args):
+    #Sends one request, retrying with a jittered exponential backoff until it works or we run out of retries
+    attempt = 0
+    while True:
+        await takeToken(bucket_lock)
+        try:
+            async with in_flight:
+                return await asyncio.to_thread(request_function, *request_args)
+        except Exception as e:
+            if not isRetryableError(e) or attempt >= AIRTABLE_MAX_RETRIES:
+                raise
+            delay = min(AIRTABLE_BACKOFF_MAX, AIRTABLE_BACKOFF_BASE * (2 ** attempt)) * random.uniform(0.5, 1.0)
+            attempt += 1
+            retry_stats['retries'] += 1
+            logging.warning('Airtable request failed (%s). Retrying in %.1f seconds (attempt %i of %i)' % (e, delay, attempt, AIRTABLE_MAX_RETRIES))
+            await asyncio.sleep(delay)
+
+def takeTokenSync():
+    #Like takeToken, for requests sent without the event loop
+    while True:
+        now = time.monotonic()
+        refill = (now - token_bucket['updated']) * AIRTABLE_REQUESTS_PER_SECOND
+        token_bucket['tokens'] = min(AIRTABLE_REQUESTS_PER_SECOND, token_bucket['tokens'] + refill)
+        token_bucket['updated'] = now
+        if token_bucket['tokens'] >= 1:
+            token_bucket['tokens'] -= 1
+            return
+        time.sleep((1 - token_bucket['tokens']) / AIRTABLE_REQUESTS_PER_SECOND)
+
+def sendAirtableRequestSync(request_function, request_args):
+    #Like sendAirtableRequest, but in this thread with time.sleep, with the same backoff
+    attempt = 0
+    while True:
+        takeTokenSync()
+        try:
+            return request_function(*request_args)
+        except Exception as e:
+            if not isRetryableError(e) or attempt >= AIRTABLE_MAX_RETRIES:
+                raise
+            delay = min(AIRTABLE_BACKOFF_MAX, AIRTABLE_BACKOFF_BASE * (2 ** attempt)) * random.uniform(0.5, 1.0)
+            attempt += 1
+            retry_stats['retries'] += 1
+            logging.warning('Airtable request failed (%s). Retrying in %.1f seconds (attempt %i of %i)' % (e, delay, attempt, AIRTABLE_MAX_RETRIES))
+            time.sleep(delay)
+
+def runAirtableRequests(request_list, sync=False):
+    #Takes a list of (request_function, request_args) and sends them all, a few at a time.
+    #Returns a list of results in the same order. A request that failed for good has its exception in the list instead.
+    #With sync=True they're sent one after the other without asyncio, which is what works while the interpreter shuts down
+    #(asyncio.to_thread can't start new threads by then)
+    if sync:
+        results = []
+        for request_function, request_args in request_list:
+            try:
+                results.append(sendAirtableRequestSync(request_function, request_args))
+            except Exception as e:
+                results.append(e)
+        return results
+    async def runAll():
+        bucket_lock = asyncio.Lock()
+        in_flight = asyncio.Semaphore(AIRTABLE_MAX_IN_FLIGHT)
+        tasks = [sendAirtableRequest(bucket_lock, in_flight, request_function, request_args) for request_function, request_args in request_list]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+    if not request_list:
+        return []
+    return asyncio.run(runAll())
+
+def updateAirtableRecord(table_name, record_id, update_dict):
+    #Sends a single update straight away, with the usual rate limiting and retries, and applies it to the local mirror in
+    #offline mode just like queued updates are. Use this for writes that can't wait for the queue (like status changes).
+    #Raises the Airtable error if the update fails for good, so callers can log it their own way
+    result = sendAirtableRequestSync(getAirtableTable(table_name).update, (record_id, update_dict))
+    if offline_mode:
+        airtableMirror.updateMirrorRecord(table_name, record_id, update_dict)
+    return result
+
+def queueAirtableUpdate(table_name, record_id, update_dict, RID, counter_dict=None, callback=None):
+    #Adds an update to the write queue. The queue is sent to Airtable 10 records at a time.
+    #counter_dict['update_counter'] and counter_dict['error_counter'] are increased for every record once its batch is sent,
+    #and callback(record_id, success) is called if one is given
+    if table_name not in update_queue:
+        update_queue[table_name] = []
+    update_queue[table_name].append({'record_id' : record_id, 'update_dict' : update_dict, 'RID' : RID, 'counter_dict' : counter_dict, 'callback' : callback})
+    if len(update_queue[table_name]) >= AIRTABLE_BATCH_SIZE:
+        batch = update_queue[table_name][:AIRTABLE_BATCH_SIZE]
+        del update_queue[table_name][:AIRTABLE_BATCH_SIZE]
+        sendAirtableBatches([(table_name, batch)])
+    return counter_dict
+
+def flushAirtableUpdates(table_name=None, sync=False):
+    #Sends everything left in the write queue for a table (or all tables) to Airtable, several batches at once.
+    #sync=True sends them one at a time without asyncio, see runAirtableRequests
+    if table_name is None:
+        table_names = list(update_queue.keys())
+    else:
+        table_names = [table_name]
+    batch_list = []
+    for name in table_names:
+        queue = update_queue.get(name, [])
+        for i in range(0, len(queue), AIRTABLE_BATCH_SIZE):
+            batch_list.append((name, queue[i:i + AIRTABLE_BATCH_SIZE]))
+        update_queue[name] = []
+    sendAirtableBatches(batch_list, sync)
+
+def sendAirtableBatches(batch_list, sync=False):
+    #Sends a list of (table_name, batch) update batches. If Airtable rejects a batch we retry each record on its own,
+    #so a single bad record doesn't count the other nine as failures
+    request_list = []
+    for name, batch in batch_list:
+        records = [{'id' : entry['record_id'], 'fields' : entry['update_dict']} for entry in batch]
+        request_list.append((getAirtableTable(name).batch_update, (records,)))
+    results = runAirtableRequests(request_list, sync)
+
+    single_list = []
+    for (name, batch), result in zip(batch_list, results):
+        if isinstance(result, Exception):
+            logging.warning('Batch update of %i record(s) in table %s failed, retrying them one at a time: %s' % (len(batch), name, result))
+            for entry in batch:
+                single_list.append((name, entry))
+        else:
+            for entry in batch:
+                reportAirtableUpdate(name, entry, True)
+
+    results = runAirtableRequests([(getAirtableTable(name).update, (entry['record_id'], entry['update_dict'])) for name, entry in single_list], sync)
+    for (name, entry), result in zip(single_list, results):
+        if isinstance(result, Exception):
+            reportAirtableUpdate(name, entry, False)
+            logging.error('%s' % result)
+        else:
+            reportAirtableUpdate(name, entry, True)
+
+def reportAirtableUpdate(table_name, entry, success):
+    #Logs the result of a queued update and keeps the caller's counters accurate
+    field_names = ', '.join(entry['update_dict'].keys())
+    if success:
+        logging.info('Succesfully updated field(s) in table %s \'%s\' for record %s ' % (table_name, field_names, entry['RID']))
+        if offline_mode:
+            airtableMirror.updateMirrorRecord(table_name, entry['record_id'], entry['update_dict'])
+        if entry['counter_dict'] is not None:
+            entry['counter_dict']['update_counter'] += 1
+    else:
+        logging.error('Could not update field(s) in table %s \'%s\' for record %s ' % (table_name, field_names, entry['RID']))
+        if entry['counter_dict'] is not None:
+            entry['counter_dict']['error_counter'] += 1
+    if entry.get('callback') is not None:
+        entry['callback'](entry['record_id'], success)
+
+def deleteAirtableRecords(table_name, delete_list, counter_dict):
+    #Deletes a list of {'record_id', 'RID'} dicts from a table, 10 records per request, several requests at once.
+    #counter_dict['delete_counter'] and counter_dict['error_counter'] are increased for every record
+    batch_list = [delete_list[i:i + AIRTABLE_BATCH_SIZE] for i in range(0, len(delete_list), AIRTABLE_BATCH_SIZE)]
+    airtable = getAirtableTable(table_name)
+    results = runAirtableRequests([(airtable.batch_delete, ([entry['record_id'] for entry in batch],)) for batch in batch_list])
+    deleted_ids = []
+
+    single_list = []
+    for batch, result in zip(batch_list, results):
+        if isinstance(result, Exception):
+            single_list.extend(batch)
+        else:
+            for entry in batch:
+                logging.info('Succesfully removed file record %s related to %s from Airtable' % (entry['record_id'], entry['RID']))
+                counter_dict['delete_counter'] += 1
+                deleted_ids.append(entry['record_id'])
+                if offline_mode:
+                    airtableMirror.deleteMirrorRecord(table_name, entry['record_id'])
+
+    results = runAirtableRequests([(airtable.delete, (entry['record_id'],)) for entry in single_list])
+    for entry, result in zip(single_list, results):
+        if isinstance(result, Exception):
+            logging.error('Could not remove file record %s related to %s from Airtable: %s' % (entry['record_id'], entry['RID'], result))
+            counter_dict['error_counter'] += 1
+        else:
+            logging.info('Succesfully removed file record %s related to %s from Airtable' % (entry['record_id'], entry['RID']))
+            counter_dict['delete_counter'] += 1
+            deleted_ids.append(entry['record_id'])
+            if offline_mode:
+                airtableMirror.deleteMirrorRecord(table_name, entry['record_id'])
+    if deleted_ids:
+        deleted_tables.add(table_name)
+        removeFromSyncCache(table_name, deleted_ids)
+    return counter_dict
+
+def flushAirtableUpdatesAtExit():
+    #Sends whatever is left in the write queue when the interpreter exits, without asyncio
+    if any(update_queue.values()):
+        logging.warning('Sending %i queued Airtable update(s) before quitting' % sum(len(queue) for queue in update_queue.values()))
+        flushAirtableUpdates(sync=True)
+
+#Make sure nothing is left in the queue if a script quits early
+atexit.register(flushAirtableUpdatesAtExit)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+# On-disk journal for checksum runs, so an interrupted run can pick up where it left off.
+# Every hashed file gets a line of JSON (path, size, mtime, digests and the Airtable update it produced), and a second
+# line is added once Airtable has accepted the update. When a run finishes the journal is cleared, which starts a new cycle.
+# If a run is interrupted (drive unplugged, laptop asleep, Ctrl-C) the next run reads the journal, skips every file that
+# was already hashed and hasn't changed since, and sends the Airtable updates that never made it without hashing again.
+
+import os
+import json
+import logging
+import airtableMirror   # The journal lives in the same cache folder as the Airtable mirror
+
+
+journal_files = {}      #open journal file for each run name ('validate', 'harvest')
+
+
+def getJournalPath(run_name):
+    return os.path.join(airtableMirror.getCacheDir(), 'checksum_journal_%s.jsonl' % run_name)
+
+def loadJournal(run_name):
+    #Returns the journal left behind by an interrupted run as a dict of file record id -> entry.
+    #Each entry has 'written' set to True if Airtable accepted its update
+    journal = {}
+    journal_path = getJournalPath(run_name)
+    if not os.path.isfile(journal_path):
+        return journal
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:      #the last line can be cut short if the run was killed while writing it
+                continue
+            if entry['event'] == 'hashed':
+                entry['written'] = False
+                journal[entry['record_id']] = entry
+            elif entry['event'] == 'written' and entry['record_id'] in journal:
+                journal[entry['record_id']]['written'] = True
+    return journal
+
+def openJournal(run_name, journal):
+    #Starts this run's journal, carrying over the entries of an interrupted run so a second interruption doesn't lose them
+    os.makedirs(airtableMirror.getCacheDir(), exist_ok=True)
+    journal_path = getJournalPath(run_name)
+    with open(journal_path + '.tmp', 'w', encoding='utf-8') as f:
+        for entry in journal.values():
+            hashed_entry = dict(entry, event='hashed')
+            del hashed_entry['written']
+            f.write(json.dumps(hashed_entry) + '\n')
+            if entry['written']:
+                f.write(json.dumps({'event' : 'written', 'record_id' : entry['record_id']}) + '\n')
+    os.replace(journal_path + '.tmp', journal_path)
+    journal_files[run_name] = open(journal_path, 'a', encoding='utf-8')
+
+def writeJournalLine(run_name, entry):
+    #Each line is flushed to disk straight away, so it survives the drive or the machine going away
+    f = journal_files.get(run_name)
+    if f is None or f.closed:
+        return
+    f.write(json.dumps(entry) + '\n')
+    f.flush()
+    os.fsync(f.fileno())
+
+def journalHashed(run_name, file_dict, digests, update_dict):
+    file_stat = file_dict.get("file_stat")
+    entry = {'event' : 'hashed', 'record_id' : file_dict["file_record_id"], 'RID' : file_dict["RID"], 'path' : file_dict["file_path"],
+             'size' : file_stat.st_size if file_stat else None, 'mtime' : file_stat.st_mtime if file_stat else None,
+             'digests' : digests, 'update' : update_dict}
+    writeJournalLine(run_name, entry)
+
+def journalWritten(run_name, record_id):
+    writeJournalLine(run_name, {'event' : 'written', 'record_id' : record_id})
+
+def getJournalCallback(run_name):
+    #Returns a write queue callback that marks an entry as written once Airtable accepts it
+    def journalCallback(record_id, success):
+        if success:
+            journalWritten(run_name, record_id)
+    return journalCallback
+
+def isJournaled(journal, record_id, file_path):
+    #True if this file was hashed earlier in the cycle and is still the same size and mtime
+    entry = journal.get(record_id)
+    if entry is None or entry['path'] != file_path:
+        return False
+    try:
+        file_stat = os.stat(file_path)
+    except OSError:
+        return False
+    return file_stat.st_size == entry['size'] and file_stat.st_mtime == entry['mtime']
+
+def getPendingWrites(journal):
+    #Returns the journal entries whose Airtable update was never confirmed
+    return [entry for entry in journal.values() if not entry['written']]
+
+def closeJournal(run_name):
+    #Ends the cycle. Updates that Airtable still hasn't accepted are kept for the next run to send, everything else is cleared
+    f = journal_files.pop(run_name, None)
+    if f is not None:
+        f.close()
+    pending_writes = getPendingWrites(loadJournal(run_name))
+    if pending_writes:
+        logging.warning('%i checksum update(s) could not be sent to Airtable. They will be sent again on the next run' % len(pending_writes))
+        openJournal(run_name, {entry['record_id'] : entry for entry in pending_writes})
+        journal_files.pop(run_name).close()
+    elif os.path.isfile(getJournalPath(run_name)):
+        os.remove(getJournalPath(run_name))
@@ -6,6 +6,11 @@ BACKUP_DRIVE_NAME = "" #The name of the backup drive
 BASE_ID = ""
 API_KEY = ""
 
+# Airtable Sync and Caching
+AIRTABLE_CACHE_PATH = ""   #Folder for the local copy of the Airtable tables. Leave blank to use an "airtable_cache" folder next to the scripts
+AIRTABLE_INCREMENTAL_SYNC = False  #Only download records that changed since the last run, instead of the whole table every time. Deleted records and changed lookup fields (like a file's record status) are only picked up at the next full refresh
+AIRTABLE_FULL_REFRESH_DAYS = 7     #How often to download whole tables anyway, to pick up deleted records and changed lookup fields
+
 # Vimeo Credentials
 YOUR_ACCESS_TOKEN = ""
 YOUR_CLIENT_ID = ""
@@ -24,9 +29,34 @@ DEPENDENCY_PATH = "/usr/local/bin/"
 CONVERT_PATH = "/usr/local/bin/convert"
 GDRIVE_PATH = "/usr/local/bin/gdrive"
 
+# mediainfo Settings
+MEDIAINFO_INFORM = True             #Ask mediainfo for only the fields the Files table uses, instead of its full XML output (which is still used if that fails)
+MEDIAINFO_CACHE = True              #Keep mediainfo results for each file in the cache folder, so unchanged files aren't run through mediainfo again
+MEDIAINFO_CACHE_DAYS = 180          #Cached results older than this are cleared out. 0 keeps them forever
+MEDIAINFO_CACHE_MAX_ENTRIES = 100000   #The most files kept in the mediainfo cache. The oldest are cleared first. 0 means no limit
+MEDIAINFO_SNIFF = True              #Recognise album images and audio (JPEG, PNG, TIFF, WAV, MP3, FLAC, M4A) from their first few KB instead of running mediainfo on them
+MEDIAINFO_BATCH_SIZE = 50           #How many album files are given to a single mediainfo run when checking an album
+MEDIAINFO_WORKERS = 4               #How many of those mediainfo runs can go at once
+
 #Various Hardcoded Values
 MAX_SIZE = 1500000000
 
+# Checksum Settings
+HASH_WORKERS = 4              #How many files are hashed at the same time during checksum harvesting and validation
+HASH_WORKERS_PER_DEVICE = 2   #How many of those can read from the same drive at once. Use 1 for a single spinning drive, more for RAIDs and SSDs
+HASH_BLOCK_SIZE = 0           #How many bytes to read at a time when hashing. 0 picks a size based on the file (1 MB, or 4 MB for files over 1 GB)
+HASH_MMAP_THRESHOLD = 67108864   #Files smaller than this (64 MB) are memory mapped and hashed in one go
+HASH_DROP_CACHE = True        #Drop files from the OS page cache once they're hashed, so long checksum runs don't slow down everything else (Linux only)
+HASH_MAX_MBPS = 0             #Caps how fast checksum validation reads from the drive, in MB/s, so it can share the machine with addRecord. 0 means no cap
+HASH_ORDER = "rid"            #The order files are hashed in. "rid" goes by record number, "inode" and "extent" follow where files sit on the disk (faster on spinning drives)
+HASH_COALESCE_SIZE = 8388608  #Runs of files smaller than this (8 MB) in the same folder, like album images, are hashed one after the other by a single worker
+HASH_COALESCE_COUNT = 32      #The most files in one of those runs
+FIXITY_ALGORITHMS = ['md5']   #Checksums computed in a single read of each file, for example ['md5', 'sha256', 'xxh64']. md5 is always included. xxh64 needs "pip3 install xxhash". Others go in Airtable only if their field below is set
+FIXITY_BYTE_BUDGET_GB = 0     #How many GB a rolling validation run (-rv) reads before it stops. 0 means no limit
+FIXITY_TIME_BUDGET_MINUTES = 0   #How many minutes a rolling validation run (-rv) can take. 0 means no limit
+STAGING_PATH = ""             #Folder addRecord.py copies new files from (one folder per record number). Files are hashed while they're copied. Leave blank to add files to the drive by hand
+FINGERPRINT_SAMPLE_SIZE = 65536   #How many bytes of the start, middle and end of each file go into the quick validation (-qv) fingerprint
+
 # Airtable Field References
 ## Records Table
 IN_LIBRARY = "(Deprecated) In Library"
@@ -76,4 +106,7 @@ FULL_FILE_NAME = "Full File Name"
 FILE_COUNT = "Folder File Count"
 CHECKSUM_VALID = "Checksum Valid"
 CHECKSUM_VALID_DATE = "Checksum Validated Date"
+CHECKSUM_SHA256 = ""    #Leave blank unless the Files table has this column, for example "Checksum SHA-256". Airtable rejects updates with unknown fields
+CHECKSUM_XXHASH = ""    #Leave blank unless the Files table has this column, for example "Checksum xxHash"
+CHECKSUM_FINGERPRINT = ""    #Leave blank unless the Files table has this column, for example "Checksum Fingerprint". Add the column in Airtable first
 FILE_COUNT = "Folder File Count"
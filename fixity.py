@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+
+# Shared checksum (fixity) code used by addRecord.py and recordMaintenance.py
+# Run this file directly with --benchmark to compare hashing methods on a real file:
+#   python3 fixity.py --benchmark /Volumes/Drive/CB0001/file.mov
+
+import os
+import mmap
+import logging
+import time
+import hashlib
+import shutil
+import json
+import argparse
+import threading
+import struct
+try:
+    import fcntl        # Needed for FIEMAP physical layout lookups. Not available on Windows
+except ImportError:
+    fcntl = None
+
+try:
+    import config
+except ImportError:     #the benchmark can run without a config.py
+    config = None
+
+try:
+    import xxhash       # Optional. Only needed if an xxHash algorithm is listed in FIXITY_ALGORITHMS (pip3 install xxhash)
+except ImportError:
+    xxhash = None
+
+
+#Files smaller than this are hashed straight out of a memory map in one go, bigger files are read in blocks
+MMAP_THRESHOLD = 64 * 1024 * 1024
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+LARGE_FILE_BLOCK_SIZE = 4 * 1024 * 1024
+LARGE_FILE_SIZE = 1024 * 1024 * 1024
+
+#How far ahead we ask the OS to read, and how much we hash before telling it to drop what's behind us from the page cache
+FADVISE_WINDOW = 32 * 1024 * 1024
+
+#Optional cap on how fast the hashing threads read, shared between all of them. 0 means no cap, see setBandwidthLimit()
+bandwidth_limit = {'bytes_per_second' : 0, 'next_time' : 0.0, 'lock' : threading.Lock()}
+
+#Linux ioctl that maps a file's logical blocks to where they physically sit on the disk (FS_IOC_FIEMAP)
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_HEADER = struct.Struct('=QQIIII')
+FIEMAP_EXTENT = struct.Struct('=QQQQQIIII')
+
+#Which Airtable field (named in config.py) each checksum algorithm is stored in. MD5 is always the Checksum field
+FIXITY_FIELD_NAMES = {'md5' : 'CHECKSUM', 'sha256' : 'CHECKSUM_SHA256', 'xxh64' : 'CHECKSUM_XXHASH', 'xxh3_64' : 'CHECKSUM_XXHASH', 'xxh128' : 'CHECKSUM_XXHASH'}
+
+#The algorithm list is worked out once per run, so a missing xxhash module is only warned about once
+fixity_algorithms = None
+
+#The sampled fingerprint hashes this much of the start, middle and end of a file, plus its size. It's a quick
+#"has this file changed?" check, not a replacement for the full checksum
+FINGERPRINT_SAMPLE_SIZE = 64 * 1024
+
+#Every record folder gets a BagIt-style manifest per checksum algorithm ("<checksum>  <path in record folder>" per line).
+#They start with a dot so the audits and the one-file-per-record checks ignore them, just like other hidden files
+MANIFEST_NAME = '.manifest-%s.txt'
+
+#Size and modified time of every album file when it was last hashed, so album validation only re-hashes files that changed
+ALBUM_STATE_NAME = '.album-state.json'
+
+#Each hashing thread keeps its own read buffer, so we aren't allocating a new bytes object for every block
+thread_buffers = threading.local()
+
+
+def getConfigValue(name, default):
+    return getattr(config, name, default) if config is not None else default
+
+def getBlockSize(file_size):
+    #HASH_BLOCK_SIZE in config.py sets the read size. 0 (or leaving it out) picks one based on the file size
+    block_size = getConfigValue('HASH_BLOCK_SIZE', 0)
+    if block_size:
+        return block_size
+    if file_size >= LARGE_FILE_SIZE:
+        return LARGE_FILE_BLOCK_SIZE
+    return DEFAULT_BLOCK_SIZE
+
+def getReadBuffer(block_size):
+    #Returns this thread's reusable buffer, growing it if a bigger block size is asked for
+    read_buffer = getattr(thread_buffers, 'buffer', None)
+    if read_buffer is None or len(read_buffer) < block_size:
+        read_buffer = bytearray(block_size)
+        thread_buffers.buffer = read_buffer
+    return read_buffer
+
+def adviseFile(fd, offset, length, advice_name):
+    #Passes a hint about how we're going to read a file to the OS. Does nothing where posix_fadvise isn't available (macOS, Windows)
+    advice = getattr(os, advice_name, None)
+    if advice is None or not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+    except OSError:
+        pass
+
+def dropFromPageCache(inputFile):
+    #Asks the OS to forget any cached pages of a file, so the next read really comes from the disk (used by benchmarks)
+    try:
+        with open(inputFile, 'rb') as f:
+            adviseFile(f.fileno(), 0, 0, 'POSIX_FADV_DONTNEED')
+    except OSError:
+        pass
+
+def setBandwidthLimit(megabytes_per_second):
+    #Caps the combined read speed of every hashing thread. 0 turns the cap off
+    with bandwidth_limit['lock']:
+        bandwidth_limit['bytes_per_second'] = int(megabytes_per_second * 1024 * 1024)
+        bandwidth_limit['next_time'] = 0.0
+
+def throttleRead(bytes_read):
+    #Each read books the next slot of time it's allowed at the capped speed, then waits for it
+    bytes_per_second = bandwidth_limit['bytes_per_second']
+    if not bytes_per_second:
+        return
+    with bandwidth_limit['lock']:
+        now = time.monotonic()
+        start_time = max(now, bandwidth_limit['next_time'])
+        bandwidth_limit['next_time'] = start_time + bytes_read / float(bytes_per_second)
+    if start_time > now:
+        time.sleep(start_time - now)
+
+def readBlocks(f, block_size):
+    #Reads an open file into this thread's reusable buffer, yielding a view of each block.
+    #We tell the OS we're reading straight through so it reads ahead, and drop the pages we've already hashed from the
+    #page cache as we go, so a long checksum run doesn't push everything else on the machine out of memory
+    fd = f.fileno()
+    drop_cache = getConfigValue('HASH_DROP_CACHE', True)
+    adviseFile(fd, 0, 0, 'POSIX_FADV_SEQUENTIAL')
+    adviseFile(fd, 0, FADVISE_WINDOW, 'POSIX_FADV_WILLNEED')
+    read_view = memoryview(getReadBuffer(block_size))[:block_size]
+    position = 0
+    advised_position = 0
+    while True:
+        bytes_read = f.readinto(read_view)
+        if not bytes_read:
+            break
+        throttleRead(bytes_read)
+        yield read_view[:bytes_read]
+        position += bytes_read
+        if position - advised_position >= FADVISE_WINDOW:
+            if drop_cache:
+                adviseFile(fd, advised_position, position - advised_position, 'POSIX_FADV_DONTNEED')
+            adviseFile(fd, position, FADVISE_WINDOW, 'POSIX_FADV_WILLNEED')
+            advised_position = position
+    if drop_cache:
+        adviseFile(fd, advised_position, 0, 'POSIX_FADV_DONTNEED')
+
+def getFixityAlgorithms():
+    #Returns the checksum algorithms to compute, from FIXITY_ALGORITHMS in config.py. MD5 is always included
+    #because it's what the Checksum field holds. xxHash algorithms are dropped if the xxhash module isn't installed
+    global fixity_algorithms
+    if fixity_algorithms is not None:
+        return fixity_algorithms
+    algorithms = ['md5']
+    for algorithm in getConfigValue('FIXITY_ALGORITHMS', ['md5']):
+        algorithm = algorithm.lower()
+        if algorithm in algorithms:
+            continue
+        if algorithm.startswith('xxh') and xxhash is None:
+            logging.warning('The xxhash module is not installed, skipping %s checksums. Run "pip3 install xxhash" to use it' % algorithm)
+            continue
+        algorithms.append(algorithm)
+    fixity_algorithms = algorithms
+    return algorithms
+
+def createHasher(algorithm):
+    if algorithm.startswith('xxh'):
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+def generateHashes(inputFile, algorithms=None, blocksize=None, use_mmap=True):
+    #Reads the file once and feeds every block to each hasher. Returns a dict of algorithm -> hex digest
+    hashers = {}
+    for algorithm in (algorithms or getFixityAlgorithms()):
+        hashers[algorithm] = createHasher(algorithm)
+
+    with open(inputFile, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        if use_mmap and not bandwidth_limit['bytes_per_second'] and 0 < file_size < getConfigValue('HASH_MMAP_THRESHOLD', MMAP_THRESHOLD):
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                if hasattr(mapped_file, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    mapped_file.madvise(mmap.MADV_SEQUENTIAL)
+                for hasher in hashers.values():
+                    hasher.update(mapped_file)
+            if getConfigValue('HASH_DROP_CACHE', True):
+                adviseFile(f.fileno(), 0, 0, 'POSIX_FADV_DONTNEED')
+        else:
+            for block in readBlocks(f, blocksize or getBlockSize(file_size)):
+                for hasher in hashers.values():
+                    hasher.update(block)
+
+    return {algorithm : hasher.hexdigest() for algorithm, hasher in hashers.items()}
+
+def generateHash(inputFile, blocksize=None, use_mmap=True):
+    '''
+    using a buffer, hash the file
+    '''
+    return generateHashes(inputFile, ['md5'], blocksize, use_mmap)['md5']
+
+def copyFileWithHashes(source_path, dest_path, algorithms=None, blocksize=None):
+    #Copies a file and hashes it in the same pass, so the copy doesn't need to be read again to get its checksums.
+    #The copy is written to a .part file and renamed once it's safely on disk. Returns a dict of algorithm -> hex digest
+    hashers = {}
+    for algorithm in (algorithms or getFixityAlgorithms()):
+        hashers[algorithm] = createHasher(algorithm)
+    part_path = dest_path + '.part'
+    try:
+        with open(source_path, 'rb') as source_file, open(part_path, 'wb') as dest_file:
+            for block in readBlocks(source_file, blocksize or getBlockSize(os.fstat(source_file.fileno()).st_size)):
+                dest_file.write(block)
+                for hasher in hashers.values():
+                    hasher.update(block)
+            dest_file.flush()
+            os.fsync(dest_file.fileno())
+        shutil.copystat(source_path, part_path)
+        os.replace(part_path, dest_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    return {algorithm : hasher.hexdigest() for algorithm, hasher in hashers.items()}
+
+def generateFingerprint(inputFile, sample_size=None):
+    #Returns "<size>:<md5 of the head, middle and tail samples>". Only three small reads, so it takes about as long
+    #as three seeks whatever the size of the file. Small files are hashed whole
+    sample_size = sample_size or getConfigValue('FINGERPRINT_SAMPLE_SIZE', FINGERPRINT_SAMPLE_SIZE)
+    md5 = hashlib.md5()
+    with open(inputFile, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        if file_size <= sample_size * 3:
+            md5.update(f.read())
+        else:
+            for offset in [0, (file_size - sample_size) // 2, file_size - sample_size]:
+                f.seek(offset)
+                md5.update(f.read(sample_size))
+    return '%i:%s' % (file_size, md5.hexdigest())
+
+def getFingerprintField():
+    #The Airtable field the fingerprint is stored in, or None if it isn't set up in config.py
+    return getConfigValue('CHECKSUM_FINGERPRINT', None)
+
+def getPhysicalOffset(inputFile):
+    #Returns the physical byte offset of the start of a file on its disk using FIEMAP, or None where that isn't
+    #supported (macOS, Windows, some filesystems)
+    if fcntl is None or not hasattr(fcntl, 'ioctl'):
+        return None
+    request = bytearray(FIEMAP_HEADER.size + FIEMAP_EXTENT.size)
+    FIEMAP_HEADER.pack_into(request, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)     #map the whole file, but we only want the first extent back
+    try:
+        with open(inputFile, 'rb') as f:
+            fcntl.ioctl(f.fileno(), FS_IOC_FIEMAP, request)
+    except (OSError, ValueError):
+        return None
+    mapped_extents = FIEMAP_HEADER.unpack_from(request, 0)[3]
+    if mapped_extents == 0:
+        return None
+    return FIEMAP_EXTENT.unpack_from(request, FIEMAP_HEADER.size)[1]
+
+def getLayoutKey(inputFile, order):
+    #Sort key for reading files in the order they sit on the disk. 'extent' uses the physical offset from FIEMAP and falls
+    #back to the inode number where that isn't available, 'inode' always uses the inode number. Files on different
+    #drives are kept apart. Files that can't be found go last
+    try:
+        file_stat = os.stat(inputFile)
+    except OSError:
+        return (float('inf'), 0)
+    if order == 'extent':
+        physical_offset = getPhysicalOffset(inputFile)
+        if physical_offset is not None:
+            return (file_stat.st_dev, physical_offset)
+    return (file_stat.st_dev, file_stat.st_ino)
+
+def sortByLayout(file_dicts, order):
+    #Sorts a list of file dicts (anything with a "file_path") into disk layout order, see getLayoutKey
+    return sorted(file_dicts, key=lambda d: getLayoutKey(d["file_path"], order))
+
+def getFixityFields(algorithms=None):
+    #Returns a dict of algorithm -> Airtable field name, for every algorithm that has a field set up in config.py
+    fixity_fields = {}
+    for algorithm in (algorithms or getFixityAlgorithms()):
+        field_name = getConfigValue(FIXITY_FIELD_NAMES.get(algorithm, ''), None)
+        if field_name:
+            fixity_fields[algorithm] = field_name
+    return fixity_fields
+
+def createFixityUpdate(digests):
+    #Turns a dict of digests into an Airtable update dict, one field per algorithm
+    fixity_fields = getFixityFields(list(digests.keys()))
+    return {fixity_fields[algorithm] : digest for algorithm, digest in digests.items() if algorithm in fixity_fields}
+
+def compareFixity(digests, airtable_fields):
+    #Compares fresh digests with what Airtable has. Returns (matched, missing_update):
+    #matched is False if any stored checksum is different, missing_update holds digests Airtable doesn't have yet
+    fixity_fields = getFixityFields(list(digests.keys()))
+    matched = True
+    missing_update = {}
+    for algorithm, field_name in fixity_fields.items():
+        stored_digest = airtable_fields.get(field_name)
+        if not stored_digest:
+            missing_update[field_name] = digests[algorithm]
+        elif stored_digest != digests[algorithm]:
+            matched = False
+    return matched, missing_update
+
+def getManifestPath(record_path, algorithm):
+    return os.path.join(record_path, MANIFEST_NAME % algorithm)
+
+def readManifests(record_path):
+    #Returns the manifests in a record folder as a dict of relative path -> {algorithm : checksum}
+    manifest_dict = {}
+    for file_name in os.listdir(record_path):
+        if not (file_name.startswith('.manifest-') and file_name.endswith('.txt')):
+            continue
+        algorithm = file_name[len('.manifest-'):-len('.txt')]
+        with open(os.path.join(record_path, file_name), 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if not line.strip():
+                    continue
+                digest, relative_path = line.split(None, 1)
+                manifest_dict.setdefault(relative_path.strip(), {})[algorithm] = digest
+    return manifest_dict
+
+def writeManifests(record_path, file_digests):
+    #Adds (or replaces) entries in a record folder's manifests. file_digests is a dict of relative path -> {algorithm : checksum}.
+    #Each manifest is written to a temp file and renamed, so an interrupted run never leaves half a manifest behind
+    manifest_dict = readManifests(record_path)
+    for relative_path, digests in file_digests.items():
+        manifest_dict[relative_path] = dict(manifest_dict.get(relative_path, {}), **digests)
+    algorithms = sorted(set(algorithm for digests in manifest_dict.values() for algorithm in digests))
+    for algorithm in algorithms:
+        manifest_path = getManifestPath(record_path, algorithm)
+        with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+            for relative_path in sorted(manifest_dict):
+                if algorithm in manifest_dict[relative_path]:
+                    f.write('%s  %s\n' % (manifest_dict[relative_path][algorithm], relative_path))
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+def generateTreeHashes(file_digests):
+    #Works out a single tree digest for a set of files (an album) from their checksums, one per algorithm. The tree digest is
+    #the hash of the sorted "<checksum>  <relative path>" lines, which is exactly that algorithm's manifest for those files,
+    #so any file that changes, appears or goes missing changes it. Only algorithms every file has a checksum for are used
+    algorithm_sets = [set(digests) for digests in file_digests.values()]
+    algorithms = set.intersection(*algorithm_sets) if algorithm_sets else set(getFixityAlgorithms())
+    tree_digests = {}
+    for algorithm in sorted(algorithms):
+        hasher = createHasher(algorithm)
+        for relative_path in sorted(file_digests):
+            hasher.update(('%s  %s\n' % (file_digests[relative_path][algorithm], relative_path)).encode('utf-8'))
+        tree_digests[algorithm] = hasher.hexdigest()
+    return tree_digests
+
+def readAlbumState(record_path):
+    #Returns a dict of relative path -> [size, mtime] from the album state file in a record folder
+    state_path = os.path.join(record_path, ALBUM_STATE_NAME)
+    if not os.path.isfile(state_path):
+        return {}
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+def writeAlbumState(record_path, album_state):
+    state_path = os.path.join(record_path, ALBUM_STATE_NAME)
+    with open(state_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(album_state, f, indent=1, sort_keys=True)
+    os.replace(state_path + '.tmp', state_path)
+
+def generateHashSimple(inputFile, blocksize=65536):
+    #The original hashing loop, kept for the benchmark to compare against
+    md5 = hashlib.md5()
+    with open(inputFile, 'rb') as f:
+        while True:
+            data = f.read(blocksize)
+            if not data:
+                break
+            md5.update(data)
+    return md5.hexdigest()
+
+def benchmarkHash(file_path, hash_function, label):
+    #Hashes a file and prints the CPU time per GB and the throughput. Run it twice on the same file
+    #if you want to take the drive out of the picture (the second run will come from the page cache)
+    file_size = os.path.getsize(file_path)
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    checksum = hash_function(file_path)
+    cpu_time = time.process_time() - cpu_start
+    wall_time = time.perf_counter() - wall_start
+    gigabytes = file_size / float(1024 ** 3)
+    print('%-24s %8.3f CPU s/GB  %9.1f MB/s  %s' % (label, cpu_time / gigabytes if gigabytes else 0, file_size / 1048576.0 / wall_time if wall_time else 0, checksum))
+    return checksum
+
+def runBenchmark(file_path):
+    print('Benchmarking %s (%.1f MB)' % (file_path, os.path.getsize(file_path) / 1048576.0))
+    benchmarkHash(file_path, generateHashSimple, 'f.read() 64 KiB')
+    for block_size in [65536, DEFAULT_BLOCK_SIZE, LARGE_FILE_BLOCK_SIZE]:
+        benchmarkHash(file_path, lambda path: generateHash(path, block_size, use_mmap=False), 'readinto() %i KiB' % (block_size // 1024))
+    benchmarkHash(file_path, lambda path: generateHash(path, use_mmap=True), 'mmap / auto')
+    benchmarkHash(file_path, lambda path: ' '.join(generateHashes(path, getFixityAlgorithms()).values()), 'all: ' + '+'.join(getFixityAlgorithms()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Shared checksum code. Run with --benchmark to compare hashing methods on a file")
+    parser.add_argument('-bm', '--benchmark', dest='bm', nargs='+', required=True, help="One or more files to benchmark")
+    args = parser.parse_args()
+    for benchmark_file in args.bm:
+        runBenchmark(benchmark_file)
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+
+# Shared mediainfo code used by addRecord.py and accessMaintenance.py
+# mediainfo's XML output is read once, with an incremental parser, into a small track model:
+#   {'General' : [{'Format_String' : 'MPEG-4', ...}], 'Video' : [{...}], 'Audio' : [{...}, {...}], ...}
+# Every track is kept (not just the first of each type), and only the text of each tag is stored.
+# Parsed track models are kept in an SQLite cache next to the Airtable mirror, keyed on each file's path, size, mtime
+# and inode, so a file that hasn't changed is never run through mediainfo twice (intake, access uploads, album checks).
+# Instead of mediainfo's full XML dump, files are probed with an --Inform template that asks for only the fields in
+# MEDIAINFO_FIELDS. The full XML is still read if the template output can't be parsed, or with MEDIAINFO_INFORM = False.
+# sniffFileType tells images, audio and video apart from their first few KB, so album checks don't need mediainfo at all.
+# Run this file directly with --benchmark to compare parse times on real files or saved mediainfo XML, or with
+# --benchmark-probe to compare full XML runs against --Inform runs:
+#   python3 mediaInfo.py --benchmark /Volumes/Drive/CB0001/file.mov saved_output.xml
+#   python3 mediaInfo.py --benchmark-probe /Volumes/Drive/CB0001/file.mov
+
+import io
+import os
+import time
+import json
+import sqlite3
+import logging
+import argparse
+import threading
+import subprocess
+import concurrent.futures
+import xml.etree.ElementTree as ET
+
+try:
+    import config
+    import airtableMirror   # The probe cache lives in the same cache folder as the Airtable mirror
+except ImportError:     #the benchmark can run on saved XML without a config.py
+    config = None
+
+
+#Where each Files table field comes from, as config field name -> (track type, mediainfo tags to try in order)
+MEDIAINFO_FIELDS = {
+    'DURATION' : ('General', ['Duration_String3']),
+    'FILE_FORMAT' : ('General', ['Format_String']),
+    'FILE_SIZE_STRING' : ('General', ['FileSize_String4']),
+    'FILE_SIZE' : ('General', ['FileSize']),
+    'VIDEO_CODEC' : ('Video', ['CodecID', 'Format']),
+    'VIDEO_BIT_DEPTH' : ('Video', ['BitDepth']),
+    'VIDEO_SCAN_TYPE' : ('Video', ['ScanType_String']),
+    'VIDEO_FRAME_RATE' : ('Video', ['FrameRate']),
+    'VIDEO_ASPECT_RATIO' : ('Video', ['DisplayAspectRatio_String']),
+    'AUDIO_SAMPLING_RATE' : ('Audio', ['SamplingRate']),
+    'AUDIO_CODEC' : ('Audio', ['Codec', 'Format']),
+}
+
+#Frame sizes are put together from two tags, for both video and image tracks
+FRAME_SIZE_TAGS = ['Width', 'Height']
+
+#Magic numbers of the formats we ingest, as (offset, bytes, file type). ISO media (MOV/MP4), MP3 frames and DV are checked in sniffFileType
+FILE_SIGNATURES = [
+    (0, b'\xff\xd8\xff', 'Image'),                # JPEG
+    (0, b'\x89PNG\r\n\x1a\n', 'Image'),           # PNG
+    (0, b'II*\x00', 'Image'),                      # TIFF, little endian
+    (0, b'MM\x00*', 'Image'),                      # TIFF, big endian
+    (8, b'WAVE', 'Audio'),                         # WAV (RIFF, RF64 and BW64)
+    (0, b'ID3', 'Audio'),                          # MP3 with an ID3 tag
+    (0, b'fLaC', 'Audio'),                         # FLAC
+    (0, b'\x1a\x45\xdf\xa3', 'Video'),              # MKV (EBML header)
+]
+ISO_AUDIO_BRANDS = [b'M4A ', b'M4B ', b'M4P ']
+ISO_IMAGE_BRANDS = [b'heic', b'heix', b'mif1', b'msf1', b'avif']
+ISO_BOX_TYPES = [b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip', b'pnot']    #older QuickTime files don't start with ftyp
+SNIFF_SIZE = 4096      #more than the longest MPEG audio frame (2881 bytes), so a second frame header can be checked
+
+#MPEG audio frame header tables, bitrates in kbit/s by (MPEG version 1 or 2, layer) and sample rates by version bits
+MPEG_BITRATES = {
+    (1, 1) : [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2) : [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3) : [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1) : [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2) : [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],      #layers II and III
+}
+MPEG_SAMPLE_RATES = {3 : [44100, 48000, 32000], 2 : [22050, 24000, 16000], 0 : [11025, 12000, 8000]}
+
+#Tracks asked for in --Inform mode, and the marker that starts each of their lines in the output
+INFORM_SECTIONS = [('General', 'G'), ('Video', 'V'), ('Audio', 'A'), ('Image', 'I')]
+inform_template_path = None
+
+cache_connection = None
+cache_lock = threading.Lock()     #probes can come from several threads, and they all share the one connection
+cache_stats = {'hits' : 0, 'runs' : 0, 'evicted' : 0, 'fallbacks' : 0}
+
+
+def getMediaInfo(*filePaths):
+    #Several files can be given at once, mediainfo then puts one <media> element per file in its output
+    cmd = [ config.MEDIAINFO_PATH, '-f', '--Output=XML' ] + list(filePaths)
+    media_info = subprocess.Popen( cmd, stdout=subprocess.PIPE ).communicate()[0]
+    return media_info
+
+def getInformTags(track_type):
+    #The tags we read from each type of track: the Files table fields in MEDIAINFO_FIELDS, the frame size, and the
+    #file's path so the output of a batch can be matched back to its files
+    tags = ['CompleteName'] if track_type == 'General' else []
+    tags += [tag for field_type, field_tags in MEDIAINFO_FIELDS.values() if field_type == track_type for tag in field_tags]
+    if track_type in ('Video', 'Image'):
+        tags += FRAME_SIZE_TAGS
+    return list(dict.fromkeys(tags))
+
+def getInformTemplate():
+    #Writes the --Inform template (one line per track, values separated by |) to the cache folder and returns its path.
+    #mediainfo's template names use / where its XML tags use _, for example Duration/String3 and <Duration_String3>
+    global inform_template_path
+    with cache_lock:
+        if inform_template_path is None:
+            template = ''.join(['%s;%s|%s\\n\n' % (track_type, marker, '|'.join(['%%%s%%' % tag.replace('_String', '/String') for tag in getInformTags(track_type)])) for track_type, marker in INFORM_SECTIONS])
+            template_path = os.path.join(airtableMirror.getCacheDir(), 'mediainfo_inform.txt')
+            os.makedirs(airtableMirror.getCacheDir(), exist_ok=True)
+            with open(template_path, 'w', encoding='utf-8') as f:
+                f.write(template)
+            inform_template_path = template_path
+    return inform_template_path
+
+def getMediaInfoInform(*filePaths):
+    #Like getMediaInfo, but asks mediainfo for only the fields in the --Inform template instead of everything it knows
+    cmd = [ config.MEDIAINFO_PATH, '--Inform=file://' + getInformTemplate() ] + list(filePaths)
+    media_info = subprocess.Popen( cmd, stdout=subprocess.PIPE ).communicate()[0]
+    return media_info
+
+def parseInformOutput(media_info_text, file_count):
+    #Reads --Inform template output into the same list of (file path, tracks) as parseMediaFiles.
+    #Returns None if anything about the output is off (a | in a value, a missing file), so the caller can fall back to XML
+    if isinstance(media_info_text, bytes):
+        media_info_text = media_info_text.decode('utf-8', 'replace')
+    media_info_text = media_info_text.replace('\\r\\n', '\n').replace('\\n', '\n')   #in case this mediainfo leaves the template's escapes alone
+    track_types = {marker : track_type for track_type, marker in INFORM_SECTIONS}
+    media_files = []
+    tracks = None
+    for line in media_info_text.splitlines():
+        if not line.strip():
+            continue
+        values = line.split('|')
+        track_type = track_types.get(values[0])
+        if track_type is None:
+            return None
+        tags = getInformTags(track_type)
+        if len(values) != len(tags) + 1:
+            return None
+        if track_type == 'General':
+            tracks = {}
+            media_files.append((values[1].strip() or None, tracks))
+        elif tracks is None:
+            return None
+        tracks.setdefault(track_type, []).append({tag : value.strip() for tag, value in zip(tags, values[1:]) if value.strip()})
+    if len(media_files) != file_count:
+        return None
+    return media_files
+
+def runMediaInfo(filePaths):
+    #Runs mediainfo once on one or more files and returns a list of (file path, tracks).
+    #With MEDIAINFO_INFORM on, only the fields we use are asked for. The full XML is only read if that output can't be parsed
+    if getattr(config, 'MEDIAINFO_INFORM', True):
+        media_files = parseInformOutput(getMediaInfoInform(*filePaths), len(filePaths))
+        if media_files is not None:
+            return media_files
+        with cache_lock:
+            cache_stats['fallbacks'] += 1
+    return parseMediaFiles(getMediaInfo(*filePaths))
+
+def stripNamespace(tag):
+    #Newer versions of mediainfo put every tag in the https://mediaarea.net/mediainfo namespace
+    return tag.rsplit('}', 1)[-1]
+
+def parseMediaFiles(media_info_text):
+    #Walks mediainfo's XML once and returns a list of (file path, tracks), one for each file in the output.
+    #tracks is a dict of track type -> list of tracks, each a dict of tag -> text.
+    #If a tag shows up more than once in a track (older mediainfo versions do this) the first one wins
+    if isinstance(media_info_text, str):
+        media_info_text = media_info_text.encode('utf-8')
+    media_files = []
+    tracks = None
+    track = None
+    depth = 0
+    track_depth = 0
+    try:
+        for event, element in ET.iterparse(io.BytesIO(media_info_text), events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                tag = stripNamespace(element.tag)
+                if tag in ('media', 'File'):     #older versions of mediainfo call it <File>, and leave the path out
+                    tracks = {}
+                    media_files.append([element.get('ref'), tracks])
+                elif track is None and tag == 'track':
+                    if tracks is None:
+                        tracks = {}
+                        media_files.append([None, tracks])
+                    track = {}
+                    track_depth = depth
+                    tracks.setdefault(element.get('type', ''), []).append(track)
+                continue
+            if track is not None:
+                if depth == track_depth:
+                    track = None
+                elif depth == track_depth + 1:
+                    track.setdefault(stripNamespace(element.tag), (element.text or '').strip())
+            if track is None:
+                element.clear()     #we've kept what we need, so the parsed tree doesn't grow with the file
+            depth -= 1
+    except ET.ParseError:
+        pass    #empty or cut off output (mediainfo missing or killed). Whatever tracks were read are kept, the callers log what's missing
+    for media_file in media_files:
+        if media_file[0] is None:
+            media_file[0] = getTrackValue(media_file[1], 'General', ['CompleteName', 'Complete_name'])
+    return [tuple(media_file) for media_file in media_files]
+
+def parseTracks(media_info_text):
+    #Returns the tracks of the (first) file in mediainfo's XML output, see parseMediaFiles
+    media_files = parseMediaFiles(media_info_text)
+    if not media_files:
+        return {}
+    return media_files[0][1]
+
+def hasTrack(tracks, track_type):
+    return len(tracks.get(track_type, [])) > 0
+
+def getTrackValue(tracks, track_type, tags, index=0):
+    #Returns the first of the tags that is set in a track, or None
+    try:
+        track = tracks[track_type][index]
+    except (KeyError, IndexError):
+        return None
+    for tag in tags:
+        if track.get(tag):
+            return track[tag]
+    return None
+
+def getFieldValue(tracks, field_name, index=0):
+    #Returns the value for a Files table field (named as in config.py, for example 'VIDEO_CODEC'), or None
+    track_type, tags = MEDIAINFO_FIELDS[field_name]
+    return getTrackValue(tracks, track_type, tags, index)
+
+def getFrameSize(tracks, track_type, index=0):
+    #Returns "<width>x<height>" for a video or image track, or None if either is missing
+    frame_width = getTrackValue(tracks, track_type, [FRAME_SIZE_TAGS[0]], index)
+    frame_height = getTrackValue(tracks, track_type, [FRAME_SIZE_TAGS[1]], index)
+    if frame_width is None or frame_height is None:
+        return None
+    return frame_width + "x" + frame_height
+
+def parseTracksSplit(media_info_text):
+    #The original way of reading mediainfo output (a str.split() per track and per field), kept for the benchmark
+    media_info_text = media_info_text.decode()
+    values = []
+    for track_type, tags in MEDIAINFO_FIELDS.values():
+        try:
+            track_text = (media_info_text.split("<track type=\"%s\">" % track_type))[1].split("</track>")[0]
+            values.append((track_text.split("<%s>" % tags[0]))[1].split("</%s>" % tags[0])[0])
+        except:
+            values.append(None)
+    return values
+
+def openProbeCache():
+    #Opens the probe cache (creating it if needed) and clears out old entries, once per run
+    global cache_connection
+    if cache_connection is None:
+        os.makedirs(airtableMirror.getCacheDir(), exist_ok=True)
+        cache_connection = sqlite3.connect(os.path.join(airtableMirror.getCacheDir(), 'mediainfo_cache.db'), check_same_thread=False)
+        cache_connection.execute('CREATE TABLE IF NOT EXISTS probes (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, inode INTEGER, probed REAL, tracks TEXT)')
+        cache_connection.execute('CREATE INDEX IF NOT EXISTS probes_probed ON probes (probed)')
+        evictProbeCache(cache_connection)
+    return cache_connection
+
+def evictProbeCache(connection):
+    #Drops entries that haven't been probed in MEDIAINFO_CACHE_DAYS, then the oldest ones over MEDIAINFO_CACHE_MAX_ENTRIES
+    max_days = getattr(config, 'MEDIAINFO_CACHE_DAYS', 180)
+    max_entries = getattr(config, 'MEDIAINFO_CACHE_MAX_ENTRIES', 100000)
+    with connection:
+        if max_days:
+            cache_stats['evicted'] += connection.execute('DELETE FROM probes WHERE probed < ?', (time.time() - max_days * 86400,)).rowcount
+        if max_entries:
+            cache_stats['evicted'] += connection.execute('DELETE FROM probes WHERE path NOT IN (SELECT path FROM probes ORDER BY probed DESC LIMIT ?)', (max_entries,)).rowcount
+
+def getCachedTracks(file_path, file_stat):
+    #Returns the cached track model for a file, or None if it isn't cached or the file has changed since it was probed
+    with cache_lock:
+        row = openProbeCache().execute('SELECT size, mtime, inode, tracks FROM probes WHERE path = ?', (file_path,)).fetchone()
+    if row is None or (row[0], row[1], row[2]) != (file_stat.st_size, file_stat.st_mtime, file_stat.st_ino):
+        return None
+    return json.loads(row[3])
+
+def cacheTracks(file_path, file_stat, tracks):
+    with cache_lock:
+        connection = openProbeCache()
+        with connection:
+            connection.execute('INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?, ?)', (file_path, file_stat.st_size, file_stat.st_mtime, file_stat.st_ino, time.time(), json.dumps(tracks)))
+
+def probeFile(filePath):
+    #Returns the track model for a file, from the cache if the file is unchanged, otherwise by running mediainfo
+    use_cache = getattr(config, 'MEDIAINFO_CACHE', True)
+    file_path = os.path.abspath(filePath)
+    try:
+        file_stat = os.stat(file_path)
+    except OSError:
+        file_stat = None
+        use_cache = False
+    if use_cache:
+        tracks = getCachedTracks(file_path, file_stat)
+        if tracks is not None:
+            cache_stats['hits'] += 1
+            return tracks
+    cache_stats['runs'] += 1
+    media_files = runMediaInfo([filePath])
+    tracks = media_files[0][1] if media_files else {}
+    if use_cache and tracks:    #an empty result means mediainfo didn't run properly, so it's tried again next time
+        cacheTracks(file_path, file_stat, tracks)
+    return tracks
+
+def probeFiles(filePaths):
+    #Returns a dict of file path -> track model for many files at once, like probeFile.
+    #Files that aren't in the cache are given to mediainfo MEDIAINFO_BATCH_SIZE at a time, and up to MEDIAINFO_WORKERS
+    #of those mediainfo runs go at once, so a folder of hundreds of images costs a handful of process launches
+    use_cache = getattr(config, 'MEDIAINFO_CACHE', True)
+    batch_size = max(1, getattr(config, 'MEDIAINFO_BATCH_SIZE', 50))
+    workers = max(1, getattr(config, 'MEDIAINFO_WORKERS', 4))
+    results = {}
+    to_probe = []
+    for filePath in filePaths:
+        file_path = os.path.abspath(filePath)
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            results[filePath] = probeFile(filePath)     #mediainfo gets to report on it the usual way
+            continue
+        tracks = getCachedTracks(file_path, file_stat) if use_cache else None
+        if tracks is not None:
+            cache_stats['hits'] += 1
+            results[filePath] = tracks
+        else:
+            to_probe.append((filePath, file_path, file_stat))
+    batches = [to_probe[i:i + batch_size] for i in range(0, len(to_probe), batch_size)]
+
+    def probeBatch(batch):
+        media_files = runMediaInfo([file_path for filePath, file_path, file_stat in batch])
+        batch_tracks = {}
+        for ref, tracks in media_files:
+            if ref is not None:
+                batch_tracks[os.path.abspath(ref)] = tracks
+        if len(batch_tracks) < len(batch) and len(media_files) == len(batch):    #no usable paths in the output, so go by order
+            batch_tracks = {file_path : tracks for (filePath, file_path, file_stat), (ref, tracks) in zip(batch, media_files)}
+        return batch_tracks
+
+    if batches:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(batches))) as executor:
+            for batch, batch_tracks in zip(batches, executor.map(probeBatch, batches)):
+                cache_stats['runs'] += 1
+                for filePath, file_path, file_stat in batch:
+                    tracks = batch_tracks.get(file_path)
+                    if not tracks:
+                        results[filePath] = probeFile(filePath)     #left out of the batch output, so it's probed on its own
+                        continue
+                    if use_cache:
+                        cacheTracks(file_path, file_stat, tracks)
+                    results[filePath] = tracks
+    return results
+
+def sniffFileType(filePath):
+    #Works out whether a file is an "Image", "Audio" or "Video" file from its first few KB, without running mediainfo.
+    #Returns None if the file isn't one of the formats in FILE_SIGNATURES, so the caller can ask mediainfo instead
+    try:
+        with open(filePath, 'rb') as f:
+            header = f.read(SNIFF_SIZE)
+    except OSError:
+        return None
+    for offset, signature, file_type in FILE_SIGNATURES:
+        if header[offset:offset + len(signature)] == signature:
+            return file_type
+    if header[4:8] in ISO_BOX_TYPES:    #MOV/MP4, which can also hold just audio (.m4a) or a still image (.heic)
+        if header[4:8] == b'ftyp' and header[8:12] in ISO_AUDIO_BRANDS:
+            return 'Audio'
+        if header[4:8] == b'ftyp' and header[8:12] in ISO_IMAGE_BRANDS:
+            return 'Image'
+        return 'Video'
+    if header[:3] == b'\x1f\x07\x00':    #DV, the header block of the first DIF sequence
+        return 'Video'
+    #MP3 (or another MPEG audio layer) with no ID3 tag in front. A lone frame sync is too easy to hit by chance (a UTF-16
+    #byte order mark is one), so the next frame header has to be where the first one says it is
+    first_frame = parseMpegAudioHeader(header, 0)
+    if first_frame is not None:
+        second_frame = parseMpegAudioHeader(header, first_frame[0])
+        if second_frame is not None and second_frame[1] == first_frame[1]:
+            return 'Audio'
+    return None
+
+def parseMpegAudioHeader(header, offset):
+    #Reads the MPEG audio frame header at offset. Returns (frame length, (version, layer, sample rate)), or None if there
+    #isn't a valid header there. Free format and reserved values are treated as invalid
+    if len(header) < offset + 4 or header[offset] != 0xff or header[offset + 1] & 0xe0 != 0xe0:
+        return None
+    version = (header[offset + 1] >> 3) & 0x03      #3 is MPEG-1, 2 is MPEG-2, 0 is MPEG-2.5
+    layer = 4 - ((header[offset + 1] >> 1) & 0x03)
+    bitrate_index = header[offset + 2] >> 4
+    sample_rate_index = (header[offset + 2] >> 2) & 0x03
+    padding = (header[offset + 2] >> 1) & 0x01
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    if version == 3:
+        bitrate = MPEG_BITRATES[(1, layer)][bitrate_index]
+    else:
+        bitrate = MPEG_BITRATES[(2, 1 if layer == 1 else 2)][bitrate_index]
+    sample_rate = MPEG_SAMPLE_RATES[version][sample_rate_index]
+    if layer == 1:
+        frame_length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+    elif layer == 3 and version != 3:
+        frame_length = 72 * bitrate * 1000 // sample_rate + padding
+    else:
+        frame_length = 144 * bitrate * 1000 // sample_rate + padding
+    return frame_length, (version, layer, sample_rate)
+
+def logMediaInfoStats():
+    #Logs how many mediainfo runs the probe cache saved this run
+    logging.info('mediainfo cache: %i file(s) read from the cache, %i mediainfo run(s), %i old entries cleared' % (cache_stats['hits'], cache_stats['runs'], cache_stats['evicted']))
+    if cache_stats['fallbacks']:
+        logging.info('mediainfo: %i --Inform run(s) could not be read and were run again with full XML output' % cache_stats['fallbacks'])
+
+def benchmarkParse(file_path, repeat=20):
+    #Parses one file's mediainfo output with both methods and prints the time per parse.
+    #A .xml file is read as saved mediainfo output, anything else is run through mediainfo first
+    if file_path.lower().endswith('.xml'):
+        with open(file_path, 'rb') as f:
+            media_info_text = f.read()
+    else:
+        media_info_text = getMediaInfo(file_path)
+    results = []
+    for label, parse_function in [('str.split() per field', parseTracksSplit), ('iterparse track model', parseTracks)]:
+        start_time = time.perf_counter()
+        for i in range(repeat):
+            parse_function(media_info_text)
+        results.append('%s %.2f ms' % (label, (time.perf_counter() - start_time) * 1000.0 / repeat))
+    tracks = parseTracks(media_info_text)
+    print('%s (%.0f KB, %s): %s' % (os.path.basename(file_path), len(media_info_text) / 1024.0, ', '.join('%i %s' % (len(track_list), track_type) for track_type, track_list in tracks.items()), ' | '.join(results)))
+
+def benchmarkProbe(file_path, repeat=20):
+    #Runs mediainfo on one file with full XML output and with the --Inform template, and prints the time per run
+    #(including parsing) and the size of each output. Also checks both ways give the same Files table values
+    results = []
+    field_values = []
+    for label, run_function, parse_function in [('full XML', getMediaInfo, parseMediaFiles), ('--Inform template', getMediaInfoInform, lambda text: parseInformOutput(text, 1))]:
+        start_time = time.perf_counter()
+        for i in range(repeat):
+            media_info_text = run_function(file_path)
+            media_files = parse_function(media_info_text)
+        results.append('%s %.1f ms, %.1f KB' % (label, (time.perf_counter() - start_time) * 1000.0 / repeat, len(media_info_text) / 1024.0))
+        tracks = media_files[0][1] if media_files else {}
+        field_values.append([getFieldValue(tracks, field_name) for field_name in MEDIAINFO_FIELDS] + [getFrameSize(tracks, 'Video'), getFrameSize(tracks, 'Image')])
+    print('%s: %s | %s' % (os.path.basename(file_path), ' | '.join(results), 'same values' if field_values[0] == field_values[1] else 'VALUES DIFFER: %s' % field_values))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Shared mediainfo code. Run with --benchmark to compare parse times on media files or saved mediainfo XML")
+    parser.add_argument('-bm', '--benchmark', dest='bm', nargs='+', help="One or more media files (or saved .xml mediainfo output) to benchmark")
+    parser.add_argument('-bp', '--benchmark-probe', dest='bp', nargs='+', help="One or more media files to run through mediainfo with full XML output and with the --Inform template")
+    parser.add_argument('-r', '--repeat', dest='r', type=int, default=20, help="How many times to parse each file")
+    args = parser.parse_args()
+    if not args.bm and not args.bp:
+        parser.error('nothing to do, give --benchmark or --benchmark-probe')
+    for benchmark_file in args.bm or []:
+        benchmarkParse(benchmark_file, args.r)
+    for benchmark_file in args.bp or []:
+        benchmarkProbe(benchmark_file, args.r)
@@ -8,13 +8,21 @@ import sys
 import platform
 import argparse         # This loads the "argparse" module, used for parsing input arguments which allows us to have a verbose mode
 import config
-import hashlib
+import threading        # Needed for the parallel checksum engine
+import time             # Needed for the rolling checksum validation budget
+import math
+import json             # Needed for saving manifest validation results
+import concurrent.futures
+import itertools
 import shutil           # Needed for auto-deaccsion subprocess
 import pathlib          # Needed for find subprocess
 import vimeo            # Needed for uploading files to Vimeo
 from datetime import datetime   # This lades the datetime module, used for getting dates and timestamps
 from pprint import pprint
-from airtable import Airtable
+from fixity import setBandwidthLimit, sortByLayout, dropFromPageCache, generateHashes, generateFingerprint, getFingerprintField, createFixityUpdate, compareFixity, readManifests, writeManifests, generateTreeHashes, readAlbumState, writeAlbumState
+from airtableMirror import getCacheDir
+from checksumJournal import loadJournal, openJournal, closeJournal, journalHashed, getJournalCallback, getPendingWrites, isJournaled
+from airtableTools import getAirtablePages, iterAirtablePages, setOfflineMode, syncAirtableMirror, clearAirtableSnapshot, logAirtableStats, queueAirtableUpdate, flushAirtableUpdates, deleteAirtableRecords, formulaEquals
 
 
 def main():
@@ -24,8 +32,19 @@ def main():
     parser.add_argument('-v', '--verbose', action='count', default=0,help="Defines verbose level for standard out (stdout). v = warning, vv = info, vvv = debug")
     parser.add_argument('-d', '--Debug',dest='d',action='store_true',default=False,help="turns on Debug mode, which send all DEBUG level (and below) messages to the log. By default logging is set to INFO level")
     parser.add_argument('-sa', '--Skip-Audit',dest='sa',action='store_true',default=False,help="Skips drive, airtable, and file audit at beginning of script")
+    parser.add_argument('-sm', '--Sync-Mirror',dest='sm',action='store_true',default=False,help="Refreshes the local copy (mirror) of the Records and Files tables from Airtable before doing anything else")
+    parser.add_argument('-off', '--Offline',dest='off',action='store_true',default=False,help="Reads Records and Files from the local mirror instead of Airtable. Changes are still written to Airtable. Run with -sm first to make sure the mirror is up to date")
     parser.add_argument('-gc', '--Get-Checksums',dest='gc',action='store_true',default=False,help="Runs the checksum harvesting subcprocess. This should really only be done once")
     parser.add_argument('-vc', '--Validate-Checksums',dest='vc',action='store_true',default=False,help="Runs the checksum validation subcprocess. This should be run on a regular basis")
+    parser.add_argument('-qv', '--Quick-Validate',dest='qv',action='store_true',default=False,help="Checks every file's sampled fingerprint (size plus the start, middle and end of the file) against Airtable. Only files that don't match get a full checksum validation. Albums only get their manifests checked and changed files re-hashed, which doesn't update their validated date")
+    parser.add_argument('-rv', '--Rolling-Validate',dest='rv',action='store_true',default=False,help="Runs checksum validation on the files and albums that were validated longest ago, stopping when the byte or time budget is used up. Run this nightly to cover the whole library on a rolling cycle")
+    parser.add_argument('-bb', '--Byte-Budget',dest='bb',type=float,default=None,help="How many GB to validate in a rolling validation run. Overrides FIXITY_BYTE_BUDGET_GB in config.py. 0 means no limit")
+    parser.add_argument('-tb', '--Time-Budget',dest='tb',type=float,default=None,help="How many minutes a rolling validation run can take. Overrides FIXITY_TIME_BUDGET_MINUTES in config.py. 0 means no limit")
+    parser.add_argument('-bw', '--Bandwidth',dest='bw',type=float,default=None,help="Caps how fast checksum validation (-vc, -qv, -rv) reads from the drive, in MB/s. Overrides HASH_MAX_MBPS in config.py. 0 means no cap")
+    parser.add_argument('-ord', '--Order',dest='ord',choices=['rid', 'inode', 'extent'],default=None,help="The order files are hashed in. rid goes by record number, inode and extent follow where the files sit on the disk, which is much faster on spinning drives. Overrides HASH_ORDER in config.py")
+    parser.add_argument('-ob', '--Order-Benchmark',dest='ob',type=float,default=None,help="Hashes this many GB from the drive in record number order and in disk layout order and logs how fast each one was")
+    parser.add_argument('-vm', '--Validate-Manifests',dest='vm',nargs='?',const=config.DRIVE_NAME,default=None,help="Checks every file on a drive against the checksum manifests in its record folders, without using Airtable. Give a drive name to check a backup drive. Skips the drive, airtable, and file audit, so it works fully offline")
+    parser.add_argument('-pm', '--Push-Manifest-Results',dest='pm',action='store_true',default=False,help="Sends the results of the last manifest validation of the main drive to Airtable's checksum valid fields in bulk")
     parser.add_argument('-da', '--Deaccession',dest='da',action='store_true',default=False,help="Runs the Deaccession subcprocess. This moves all records marked \"Not in Library\" to a _Trash folder. This should be run on a regular basis")
     args = parser.parse_args()
 
@@ -80,12 +99,24 @@ def main():
 
     #airtable = Airtable(base_key, table_name, api_key)
 
+    #Refresh the local mirror of Airtable, then read from it if we're running offline
+    if args.sm:
+        syncAirtableMirror()
+    if args.off:
+        if not setOfflineMode(True):
+            logging.critical('========Script Complete========')
+            quit()
+
+    #Check a drive against the manifests in its record folders. This doesn't use Airtable at all
+    if args.vm:
+        validateManifests(args.vm)
+
     #Perform audio-deaccession This needs to run first to keep everything else up to date
     if args.da:
         deaccession()
 
-    #skip audits if run with -sa flag
-    if not args.sa:
+    #skip audits if run with -sa flag, or when validating manifests, which has to work without Airtable or the main drive
+    if not args.sa and not args.vm:
 
         #Perform a drive audit. Quit upon failure
         drive_audit = driveAudit()
@@ -106,10 +137,20 @@ def main():
                 logging.error('Airtable audit failed. Please fix this before continuing.')
             if not file_audit:
                 logging.error('File audit failed. Please fix this before continuing.')
+            logAirtableStats()
             logging.critical('========Script Complete========')
+            flushAirtableUpdates()     #send anything already queued before quitting
             quit()
 
 
+    #Checksum validation can be slowed down so it doesn't hog the drive
+    if args.bw is not None:
+        config.HASH_MAX_MBPS = args.bw
+    if args.ord is not None:
+        config.HASH_ORDER = args.ord
+    if args.ob:
+        benchmarkHashOrder(args.ob)
+
     #Harvest checksums for any non-album records missing a checksum
     if args.gc:
         getChecksums()
@@ -118,6 +159,20 @@ def main():
     if args.vc:
         validateChecksums()
 
+    #Quick check of every file's fingerprint, with a full validation of the ones that changed
+    if args.qv:
+        validateChecksums(quick=True)
+
+    #Validate the files that have gone longest without validation, within this run's budget
+    if args.rv:
+        byte_budget = args.bb if args.bb is not None else getattr(config, 'FIXITY_BYTE_BUDGET_GB', 0)
+        time_budget = args.tb if args.tb is not None else getattr(config, 'FIXITY_TIME_BUDGET_MINUTES', 0)
+        validateChecksums(rolling=True, byte_budget=byte_budget * 1024 ** 3, time_budget=time_budget * 60)
+
+    #Send the results of the last manifest validation to Airtable
+    if args.pm:
+        pushManifestResults()
+
 
 
     #Perform find subcprocess
@@ -149,32 +204,133 @@ def main():
 #        uploadVimeo(airtable, v, drive_name, args.uv)
         # Setup Vimeo Credentials for API_KEY
 
+    logAirtableStats()
     logging.critical('========Script Complete========')
 
 ## End of main function
 
 
-def generateHash(inputFile, blocksize=65536):
-    '''
-    using a buffer, hash the file
-    '''
-    md5 = hashlib.md5()
-
-    with open(inputFile, 'rb') as f:
-        while True:
-            data = f.read(blocksize)
-            if not data:
-                break
-            md5.update(data)
-
-    return md5.hexdigest()
-
-def getAirtablePages(table_name):
-    #takes table name, returns pages.
-    #BASE_ID and API_KEY come from config.py file.
-    airtable = Airtable(config.BASE_ID, table_name, config.API_KEY)
-    pages = airtable.get_iter()
-    return pages
+def getDeviceLock(file_path, device_locks):
+    #Returns the semaphore for the physical device a file lives on, so no more than HASH_WORKERS_PER_DEVICE files
+    #are read from the same drive at once. Extra readers on one spinning drive just make it seek back and forth
+    try:
+        device = os.stat(file_path).st_dev
+    except OSError:
+        device = None
+    with device_locks['lock']:
+        if device not in device_locks:
+            device_locks[device] = threading.BoundedSemaphore(getattr(config, 'HASH_WORKERS_PER_DEVICE', 2))
+        return device_locks[device]
+
+def hashFileWorker(file_dict, device_locks, fingerprint=False):
+    #Runs in a worker thread. hashlib lets go of the GIL while it hashes, so several of these really do run at once.
+    #Every algorithm in FIXITY_ALGORITHMS is computed from the same read of the file. With fingerprint=True the
+    #sampled fingerprint is added to the file dict as well
+    try:
+        with getDeviceLock(file_dict["file_path"], device_locks):
+            file_dict["file_stat"] = os.stat(file_dict["file_path"])     #size and mtime go in the checkpoint journal
+            file_digests = generateHashes(file_dict["file_path"])
+            if fingerprint:
+                file_dict["fingerprint"] = generateFingerprint(file_dict["file_path"])
+            return file_dict, file_digests, None
+    except Exception as e:
+        return file_dict, None, e
+
+def fingerprintWorker(file_dict, device_locks, fingerprint=True):
+    #Runs in a worker thread. Only reads the samples for the fingerprint, returns (file_dict, fingerprint, error).
+    #fingerprint isn't used, it's only there so hashFileStage can call this the same way as hashFileWorker
+    try:
+        with getDeviceLock(file_dict["file_path"], device_locks):
+            return file_dict, generateFingerprint(file_dict["file_path"]), None
+    except Exception as e:
+        return file_dict, None, e
+
+def hashFileBatchWorker(file_dict_batch, device_locks, fingerprint, worker):
+    #Hashes a batch of files one after the other on a single worker thread, so a folder of small files is read in order
+    return [worker(file_dict, device_locks, fingerprint) for file_dict in file_dict_batch]
+
+def coalesceSmallFiles(file_dicts):
+    #Groups runs of small files from the same folder (album images, mostly) into batches of up to HASH_COALESCE_COUNT,
+    #so one worker reads them in order instead of several workers seeking back and forth between them.
+    #Files of HASH_COALESCE_SIZE bytes or more go in a batch of their own
+    coalesce_size = getattr(config, 'HASH_COALESCE_SIZE', 8 * 1024 * 1024)
+    coalesce_count = getattr(config, 'HASH_COALESCE_COUNT', 32)
+    batch = []
+    for file_dict in file_dicts:
+        small_file = coalesce_size and getFileSize(file_dict) < coalesce_size
+        if batch and (not small_file or len(batch) >= coalesce_count or os.path.dirname(file_dict["file_path"]) != os.path.dirname(batch[0]["file_path"])):
+            yield batch
+            batch = []
+        if small_file:
+            batch.append(file_dict)
+        else:
+            yield [file_dict]
+    if batch:
+        yield batch
+
+def hashFileStage(file_dicts, fingerprint=False, worker=hashFileWorker, order=None):
+    #Hashes files on a pool of worker threads and yields (file_dict, digests, error) as each one finishes,
+    #so results can go straight to the Airtable write queue. Files keep arriving from the previous stage while we hash.
+    #HASH_WORKERS sets the size of the pool and HASH_WORKERS_PER_DEVICE caps how many of them read from the same drive
+    workers = max(1, getattr(config, 'HASH_WORKERS', 4))
+    device_locks = {'lock' : threading.Lock()}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for file_dict_batch in coalesceSmallFiles(layoutOrderStage(file_dicts, order)):
+            pending.add(executor.submit(hashFileBatchWorker, file_dict_batch, device_locks, fingerprint, worker))
+            if len(pending) >= workers * 2:     #don't let the list of waiting files get far ahead of the workers
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    for result in future.result():
+                        yield result
+        for future in concurrent.futures.as_completed(pending):
+            for result in future.result():
+                yield result
+
+def layoutOrderStage(file_dicts, order=None):
+    #With HASH_ORDER set to 'inode' or 'extent' every file is collected first and then hashed in the order it sits on the
+    #disk instead of by RID, which saves a lot of seeking on spinning drives. 'rid' passes files straight through as they arrive
+    order = order or getattr(config, 'HASH_ORDER', 'rid')
+    if order not in ['inode', 'extent']:
+        for file_dict in file_dicts:
+            yield file_dict
+        return
+    file_dict_list = list(file_dicts)
+    logging.info('Sorting %i files into disk layout order (%s)' % (len(file_dict_list), order))
+    for file_dict in sortByLayout(file_dict_list, order):
+        yield file_dict
+
+def benchmarkHashOrder(limit_gb):
+    #Hashes the same files from the drive (the first limit_gb GB by RID) in RID order, inode order and extent order, and
+    #logs the throughput of each. Files are dropped from the page cache before each pass so every pass reads from the disk.
+    #That only works on Linux, on macOS run "sudo purge" before the benchmark and compare runs of one order at a time
+    drive_path = os.path.join('/Volumes', config.DRIVE_NAME)
+    file_dicts = []
+    total_bytes = 0
+    for RID in sorted(os.listdir(drive_path)):
+        record_path = os.path.join(drive_path, RID)
+        if RID.startswith('.') or not os.path.isdir(record_path):
+            continue
+        for root, dirs, files in os.walk(record_path):
+            dirs[:] = sorted([d for d in dirs if not d.startswith('.')])
+            for file_name in sorted(files):
+                if not file_name.startswith('.'):
+                    file_path = os.path.join(root, file_name)
+                    file_dicts.append({"RID": RID, "file_path": file_path, "file_size": os.path.getsize(file_path)})
+                    total_bytes += file_dicts[-1]["file_size"]
+        if total_bytes >= limit_gb * 1024 ** 3:
+            break
+    if platform.system() != 'Linux':
+        logging.warning('The page cache can only be cleared between passes on Linux, later passes may look faster than they are')
+    logging.info('Benchmarking hashing order on %i files (%.1f GB)' % (len(file_dicts), total_bytes / 1024.0 ** 3))
+    for order in ['rid', 'inode', 'extent']:
+        for file_dict in file_dicts:
+            dropFromPageCache(file_dict["file_path"])
+        start_time = time.monotonic()
+        error_count = len([hash_error for file_dict, file_digests, hash_error in hashFileStage(file_dicts, order=order) if hash_error is not None])
+        elapsed_time = time.monotonic() - start_time
+        logging.info('%-8s order: %8.1f MB/s (%.0f seconds, %i errors)' % (order, total_bytes / 1048576.0 / elapsed_time if elapsed_time else 0, elapsed_time, error_count))
+        print('%-8s order: %8.1f MB/s' % (order, total_bytes / 1048576.0 / elapsed_time if elapsed_time else 0))
 
 def driveAudit():
     #This performs a quick drive audit, checking to see if drive contains every record labeled as "in library" in airtable
@@ -431,21 +587,307 @@ def fileAudit():
         logging.info('File-level audit complete, 0 errors found.')
         return True
 
-def validateChecksums():
+def validateChecksums(rolling=False, byte_budget=0, time_budget=0, quick=False):
     #this has been succesfull updated
     #This section validates file checksums and updates the "last validated date" field
     #For now it will only get the first filename, and warns if there is more than one file in the folder
+    #Files are hashed page by page as Airtable sends them, so the drive is busy while the rest of the table downloads.
+    #If the audits ran first (no -sa) the Files table is already in the snapshot, so there is nothing left to overlap
+    #In rolling mode the files validated longest ago go first, and the run stops once byte_budget (bytes) or time_budget (seconds) is used up
+    #In quick mode only files whose sampled fingerprint doesn't match Airtable get a full validation
     drive_name = config.DRIVE_NAME
-    airtable = Airtable(config.BASE_ID, "Files", config.API_KEY)
     print('Validating Checksums and updating airtable')
     logging.info('Validating Checksums and updating airtable')
-    update_counter = 0
+    bandwidth_cap = getattr(config, 'HASH_MAX_MBPS', 0)
+    if bandwidth_cap:
+        logging.info('Checksum validation reads are capped at %.1f MB/s' % bandwidth_cap)
+    setBandwidthLimit(bandwidth_cap)
+    counter_dict = {'update_counter' : 0, 'error_counter' : 0}    #filled in by the Airtable write queue as batches are sent
     checksum_error_counter = 0
     checksum_validate_counter = 0
-    pages = getAirtablePages("Files")
+    stage_counter_dict = {'error_counter' : 0, 'resumed_counter' : 0}
+    journal = resumeJournal('validate', counter_dict)
+    schedule_dict = {'total_bytes' : 0, 'total_files' : 0, 'scheduled_files' : 0, 'validated_bytes' : 0, 'oldest_remaining' : None, 'start_time' : time.monotonic()}
+    quick_counter_dict = {'matched_counter' : 0, 'escalated_counter' : 0, 'no_fingerprint_counter' : 0}
+    fingerprint_field = getFingerprintField()
+    album_list = []     #albums whose files are in this run, see finishAlbumValidation
+    if rolling:
+        file_dicts = rollingValidationStage(drive_name, stage_counter_dict, schedule_dict, album_list, byte_budget, time_budget, journal)
+    elif quick:     #albums only get their metadata checked (and changed files re-hashed), which doesn't count as a validation
+        file_dicts = itertools.chain(quickValidationStage(fileValidationStage(iterAirtablePages("Files"), drive_name, stage_counter_dict, journal=journal), quick_counter_dict), albumValidationStage(drive_name, stage_counter_dict, album_list, full=False))
+    else:
+        file_dicts = itertools.chain(fileValidationStage(iterAirtablePages("Files"), drive_name, stage_counter_dict, journal=journal), albumValidationStage(drive_name, stage_counter_dict, album_list, full=True))
+
+    order = 'rid' if rolling else None     #rolling runs keep their oldest-first order, so the budget is spent on the right files
+    for file_dict_entry, file_digests, hash_error in hashFileStage(file_dicts, fingerprint=bool(fingerprint_field), order=order):    #this is where we actually get the checksum
+        #these next four lines are just here to show how to access dictionary entries for file info from airtable
+        #print("RID: " + file_dict_entry["RID"])
+        #print("file_record_id: " + file_dict_entry["file_record_id"])
+        #print("airtable_checksum: " + file_dict_entry["airtable_checksum"])
+        #print("file_path: " + file_dict_entry["file_path"])
+
+        if "album" in file_dict_entry:      #album files are checked against the album's manifest, and the album is written to Airtable at the end
+            if hash_error is None:
+                schedule_dict['validated_bytes'] += file_dict_entry["file_size"]
+            checkAlbumFile(file_dict_entry, file_digests, hash_error)
+            continue
+        if hash_error is not None:
+            logging.error('Could not read file for record %s, filename %s. Check that the file is on the drive: %s' % (file_dict_entry["RID"], file_dict_entry["file_path"], hash_error))
+            checksum_error_counter += 1
+            continue
+        schedule_dict['validated_bytes'] += file_dict_entry.get("file_size", 0)
+        #Every stored checksum has to match. Checksums Airtable doesn't have yet (say SHA-256 on older records) are filled in
+        checksums_match, missing_update = compareFixity(file_digests, file_dict_entry["airtable_fields"])
+        if checksums_match:
+            logging.info('Checksum validation succesful for record %s' % file_dict_entry["RID"])
+            update_dict = {config.CHECKSUM_VALID: 'Yes', config.CHECKSUM_VALID_DATE: datetime.today().strftime('%Y-%m-%d')}
+            update_dict.update(missing_update)
+            if fingerprint_field and file_dict_entry["airtable_fields"].get(fingerprint_field) != file_dict_entry["fingerprint"]:
+                update_dict[fingerprint_field] = file_dict_entry["fingerprint"]     #the file is good, so its fingerprint is too
+            checksum_validate_counter += 1
+            updateRecordManifest(file_dict_entry, file_digests, only_missing=True)     #gives older records a manifest the first time they validate
+        else:
+            logging.error('Checksum validation failed for record %s' % file_dict_entry["RID"])
+            update_dict = {config.CHECKSUM_VALID: 'No', config.CHECKSUM_VALID_DATE: datetime.today().strftime('%Y-%m-%d')}
+            checksum_error_counter += 1
+
+        #THIS IS THE IMPORTANT BIT WHERE WE UPDATE THE TABLE!
+        #Updates are journaled first, then queued and sent to Airtable 10 records at a time
+        journalHashed('validate', file_dict_entry, file_digests, update_dict)
+        queueAirtableUpdate("Files", file_dict_entry["file_record_id"], update_dict, file_dict_entry["RID"], counter_dict, getJournalCallback('validate'))
+
+    album_validate_counter, album_error_counter = finishAlbumValidation(album_list, counter_dict)
+    checksum_validate_counter += album_validate_counter
+    checksum_error_counter += album_error_counter
+
+    flushAirtableUpdates("Files")
+    closeJournal('validate')
+    checksum_error_counter += counter_dict['error_counter'] + stage_counter_dict['error_counter']
+    logging.info('Checksum Validation complete. %i records succesfully validated, %i Airtable records updated, %i errors encountered. %i files skipped because they were already validated by an interrupted run.' % (checksum_validate_counter, counter_dict['update_counter'], checksum_error_counter, stage_counter_dict['resumed_counter']))
+    if rolling:
+        logRollingProjection(schedule_dict)
+    setBandwidthLimit(0)
+    if quick:
+        logging.info('Quick validation complete. %i fingerprints matched, %i files escalated to a full checksum validation, %i files have no fingerprint yet (run -vc or -rv to add them).' % (quick_counter_dict['matched_counter'], quick_counter_dict['escalated_counter'], quick_counter_dict['no_fingerprint_counter']))
+    return
 
-    file_dict_list = []    #need to put everything in a list of dicts so that airtable doesn't time out
+def quickValidationStage(file_dicts, counter_dict):
+    #Checks each file's sampled fingerprint against Airtable, several files at once, and only hands on the files that need
+    #a full checksum validation because their fingerprint doesn't match or couldn't be read.
+    #Matching files are left alone, a matching fingerprint isn't a full validation so the validated date isn't changed
+    fingerprint_field = getFingerprintField()
+    if not fingerprint_field:
+        logging.error('No CHECKSUM_FINGERPRINT field set in config.py, quick validation can\'t run')
+        return
+
+    def fingerprintedFiles():
+        for file_dict in file_dicts:
+            if file_dict["airtable_fields"].get(fingerprint_field):
+                yield file_dict
+            else:
+                counter_dict['no_fingerprint_counter'] += 1
+
+    for file_dict, fingerprint, fingerprint_error in hashFileStage(fingerprintedFiles(), worker=fingerprintWorker):
+        if fingerprint_error is None and fingerprint == file_dict["airtable_fields"][fingerprint_field]:
+            counter_dict['matched_counter'] += 1
+            continue
+        logging.warning('Fingerprint mismatch for record %s, running a full checksum validation' % file_dict["RID"])
+        counter_dict['escalated_counter'] += 1
+        yield file_dict
+
+def updateRecordManifest(file_dict, digests, only_missing=False):
+    #Writes a file's checksums into the manifests in its record folder. With only_missing the manifests are only
+    #touched if they don't list the file yet
+    record_path, file_name = os.path.split(file_dict["file_path"])
+    try:
+        if only_missing and file_name in readManifests(record_path):
+            return
+        writeManifests(record_path, {file_name : digests})
+    except Exception as e:
+        logging.warning('Could not write the checksum manifest for record %s: %s' % (file_dict["RID"], e))
+
+def getManifestResultsPath(drive_name):
+    return os.path.join(getCacheDir(), 'manifest_results_%s.json' % drive_name)
+
+def validateManifests(drive_name):
+    #Checks every file on a drive against the manifests in its record folders, hashing several files at once.
+    #Nothing here talks to Airtable, so it works offline and on backup drives. The results are saved in the cache folder
+    #and can be sent to Airtable afterwards with -pm
+    drive_path = os.path.join('/Volumes', drive_name)
+    print('Validating drive %s against its checksum manifests' % drive_name)
+    logging.info('Validating drive %s against its checksum manifests' % drive_name)
+    if not os.path.isdir(drive_path):
+        logging.error('Drive %s not found. Check that the drive is mounted' % drive_name)
+        return False
+    counter_dict = {'error_counter' : 0, 'missing_counter' : 0, 'unlisted_counter' : 0}
+    valid_counter = 0
+    failed_counter = 0
+    results = {}
+
+    for file_dict_entry, file_digests, hash_error in hashFileStage(manifestFileStage(drive_path, counter_dict)):
+        if hash_error is not None:
+            logging.error('Could not read file %s in record %s: %s' % (file_dict_entry["relative_path"], file_dict_entry["RID"], hash_error))
+            counter_dict['error_counter'] += 1
+            continue
+        checked_algorithms = [algorithm for algorithm in file_dict_entry["manifest_digests"] if algorithm in file_digests]
+        if not checked_algorithms:
+            logging.warning('None of the checksums in the manifest for %s in record %s are computed by this setup (see FIXITY_ALGORITHMS in config.py)' % (file_dict_entry["relative_path"], file_dict_entry["RID"]))
+            continue
+        if all(file_digests[algorithm] == file_dict_entry["manifest_digests"][algorithm] for algorithm in checked_algorithms):
+            logging.info('Manifest validation succesful for %s in record %s' % (file_dict_entry["relative_path"], file_dict_entry["RID"]))
+            valid = 'Yes'
+            valid_counter += 1
+        else:
+            logging.error('Manifest validation failed for %s in record %s' % (file_dict_entry["relative_path"], file_dict_entry["RID"]))
+            valid = 'No'
+            failed_counter += 1
+        results[file_dict_entry["RID"] + '/' + file_dict_entry["relative_path"]] = {'RID' : file_dict_entry["RID"], 'relative_path' : file_dict_entry["relative_path"], 'valid' : valid, 'date' : datetime.today().strftime('%Y-%m-%d')}
+
+    os.makedirs(getCacheDir(), exist_ok=True)
+    with open(getManifestResultsPath(drive_name), 'w', encoding='utf-8') as f:
+        json.dump(results, f)
+    logging.info('Manifest validation complete. %i files validated, %i files failed validation, %i files could not be read, %i record folders have no manifest, %i files are not listed in a manifest.' % (valid_counter, failed_counter, counter_dict['error_counter'], counter_dict['missing_counter'], counter_dict['unlisted_counter']))
+    return failed_counter == 0 and counter_dict['error_counter'] == 0
+
+def manifestFileStage(drive_path, counter_dict):
+    #Yields a file dict for every file listed in the manifests of every record folder on the drive, in RID order
+    for RID in sorted(os.listdir(drive_path)):
+        record_path = os.path.join(drive_path, RID)
+        if RID.startswith('.') or not os.path.isdir(record_path):
+            continue
+        try:
+            manifest_dict = readManifests(record_path)
+        except Exception as e:
+            logging.error('Could not read the checksum manifest for record %s: %s' % (RID, e))
+            counter_dict['error_counter'] += 1
+            continue
+        if not manifest_dict:
+            logging.warning('No checksum manifest found in record folder %s' % RID)
+            counter_dict['missing_counter'] += 1
+            continue
+        for file_name in os.listdir(record_path):
+            if not file_name.startswith('.') and os.path.isfile(os.path.join(record_path, file_name)) and file_name not in manifest_dict:
+                logging.warning('File %s in record folder %s is not listed in its checksum manifest' % (file_name, RID))
+                counter_dict['unlisted_counter'] += 1
+        for relative_path in sorted(manifest_dict):
+            yield {"RID": RID, "file_path": os.path.join(record_path, relative_path), "relative_path": relative_path, "manifest_digests": manifest_dict[relative_path]}
+
+def pushManifestResults():
+    #Sends the results of the last manifest validation of the main drive to Airtable, 10 records at a time
+    drive_name = config.DRIVE_NAME
+    results_path = getManifestResultsPath(drive_name)
+    print('Sending manifest validation results to Airtable')
+    logging.info('Sending manifest validation results to Airtable')
+    if not os.path.isfile(results_path):
+        logging.error('No manifest validation results found for drive %s. Run with -vm first' % drive_name)
+        return False
+    with open(results_path, 'r', encoding='utf-8') as f:
+        results = json.load(f)
+
+    files_index = {}
+    for page in getAirtablePages("Files"):
+        for at_file in page:
+            try:
+                files_index[(at_file['fields'][config.RECORD_NUMBER_LOOKUP][0], at_file['fields'][config.FULL_FILE_NAME])] = at_file['id']
+            except Exception as e:
+                continue
+
+    counter_dict = {'update_counter' : 0, 'error_counter' : 0}
+    not_found_counter = 0
+    for result in results.values():
+        file_record_id = files_index.get((result['RID'], result['relative_path']))
+        if file_record_id is None:      #album images are in the manifests but don't have their own Files records
+            not_found_counter += 1
+            continue
+        update_dict = {config.CHECKSUM_VALID: result['valid'], config.CHECKSUM_VALID_DATE: result['date']}
+        queueAirtableUpdate("Files", file_record_id, update_dict, result['RID'], counter_dict)
+    flushAirtableUpdates("Files")
+    if counter_dict['error_counter'] == 0:
+        os.remove(results_path)
+    logging.info('Manifest results sent. %i Airtable records updated, %i errors encountered, %i results had no matching file record.' % (counter_dict['update_counter'], counter_dict['error_counter'], not_found_counter))
+    return True
+
+def resumeJournal(run_name, counter_dict):
+    #Picks up the checkpoint journal left by an interrupted run. Updates it hashed but never got into Airtable are
+    #queued again straight away (no hashing needed), and the journal is returned so the stages can skip its files
+    journal = loadJournal(run_name)
+    pending_writes = getPendingWrites(journal)
+    if journal:
+        logging.info('Resuming an interrupted checksum run: %i files already hashed, %i Airtable updates still to send' % (len(journal), len(pending_writes)))
+    openJournal(run_name, journal)
+    for entry in pending_writes:
+        queueAirtableUpdate("Files", entry['record_id'], entry['update'], entry['RID'], counter_dict, getJournalCallback(run_name))
+    return journal
+
+def getFileSize(file_dict):
+    #Uses the File Size Bytes field from Airtable if it's there, so we don't have to touch the drive just to plan the run
+    if "file_size" in file_dict:
+        return file_dict["file_size"]
+    try:
+        return int(file_dict["airtable_fields"][config.FILE_SIZE])
+    except Exception as e:
+        try:
+            return os.path.getsize(file_dict["file_path"])
+        except OSError:
+            return 0
+
+def rollingValidationStage(drive_name, counter_dict, schedule_dict, album_list, byte_budget=0, time_budget=0, journal=None):
+    #Orders every file and album that has a checksum by its Checksum Validated Date, never validated first and then oldest first,
+    #and yields them until this run's byte budget or time budget is used up. A budget of 0 means no limit.
+    #An album is scheduled as a whole (all of its files, counted against the budget together) and added to album_list.
+    #The hashing stage works a few files ahead, so a time budget can run over by about as long as those files take to hash
+    file_dict_list = list(fileValidationStage(getAirtablePages("Files"), drive_name, counter_dict, sort_pages=False, journal=journal))
+    for album in albumStage(getAirtablePages("Files"), drive_name, counter_dict, harvest=False):
+        album["album_files"] = prepareAlbumValidation(album, full=True)
+        file_dict_list.append(album)
+    file_dict_list = sorted(file_dict_list, key=lambda d: (d["airtable_fields"].get(config.CHECKSUM_VALID_DATE, ''), d['RID']))
+    for file_dict in file_dict_list:
+        file_dict["file_size"] = getFileSize(file_dict)
+        schedule_dict['total_bytes'] += file_dict["file_size"]
+    schedule_dict['total_files'] = len(file_dict_list)
+    logging.info('Rolling validation: %i files (%.1f GB) have checksums. Byte budget: %s, time budget: %s' % (len(file_dict_list), schedule_dict['total_bytes'] / 1024.0 ** 3, '%.1f GB' % (byte_budget / 1024.0 ** 3) if byte_budget else 'none', '%.0f minutes' % (time_budget / 60.0) if time_budget else 'none'))
+
+    scheduled_bytes = 0
+    for file_dict in file_dict_list:
+        if byte_budget and scheduled_bytes > 0 and scheduled_bytes + file_dict["file_size"] > byte_budget:
+            logging.info('Rolling validation: byte budget used up, stopping before record %s' % file_dict['RID'])
+            schedule_dict['oldest_remaining'] = file_dict["airtable_fields"].get(config.CHECKSUM_VALID_DATE, 'never validated')
+            break
+        if time_budget and time.monotonic() - schedule_dict['start_time'] >= time_budget:
+            logging.info('Rolling validation: time budget used up, stopping before record %s' % file_dict['RID'])
+            schedule_dict['oldest_remaining'] = file_dict["airtable_fields"].get(config.CHECKSUM_VALID_DATE, 'never validated')
+            break
+        scheduled_bytes += file_dict["file_size"]
+        schedule_dict['scheduled_files'] += 1
+        if "album_files" in file_dict:
+            album_list.append(file_dict)
+            for album_file_dict in file_dict["album_files"]:
+                yield album_file_dict
+        else:
+            yield file_dict
+
+def logRollingProjection(schedule_dict):
+    #Works out how long it will take to validate the whole library at the rate of this run
+    elapsed_time = time.monotonic() - schedule_dict['start_time']
+    validated_bytes = schedule_dict['validated_bytes']
+    total_bytes = schedule_dict['total_bytes']
+    if elapsed_time > 0:
+        logging.info('Rolling validation: %i of %i files scheduled, %.1f GB validated in %.0f minutes (%.1f MB/s)' % (schedule_dict['scheduled_files'], schedule_dict['total_files'], validated_bytes / 1024.0 ** 3, elapsed_time / 60.0, validated_bytes / 1048576.0 / elapsed_time))
+    if schedule_dict.get('oldest_remaining'):
+        logging.info('Rolling validation: the oldest file still waiting was last validated: %s' % schedule_dict['oldest_remaining'])
+    if validated_bytes == 0:
+        logging.warning('Rolling validation: nothing was validated this run, so no projection can be made')
+        return
+    runs_needed = int(math.ceil(total_bytes / float(validated_bytes)))
+    logging.info('Rolling validation: at this rate the whole library (%.1f GB) is validated every %i runs. Run nightly, that is a full cycle every %i days (about %.1f hours of hashing in total)' % (total_bytes / 1024.0 ** 3, runs_needed, runs_needed, total_bytes / (validated_bytes / elapsed_time) / 3600.0))
+    print('Projected time to validate the whole library: %i nightly runs' % runs_needed)
+
+def fileValidationStage(pages, drive_name, counter_dict, sort_pages=True, journal=None):
+    #Takes Files pages as they arrive and yields a file dict for every file that has a checksum to validate.
+    #Each page is sorted by RID before it's handed on so the user can see the big numbers go up (within each page)
+    #Files already hashed by an interrupted run (see the checkpoint journal) are skipped
     for page in pages:
+        file_dict_list = []
         for at_file in page:
             try:
                 record_status = at_file['fields'][config.RECORD_STATUS_LOOKUP][0]
@@ -455,7 +897,7 @@ def validateChecksums():
                 file_format = at_file['fields'][config.FILE_FORMAT]
             except Exception as e:
                 file_format = "none"
-            if file_format == "Album":    #we can skip this whole process for Albums, they don't have checksums
+            if file_format == "Album":    #albums are handled on their own, see getAlbumChecksums and finishAlbumValidation
                 continue
             if record_status != config.RECORD_DEACCESS_FLAG:     #only process records that are in the library and aren't albums
                 file_record_id = at_file['id']
@@ -464,58 +906,33 @@ def validateChecksums():
                     airtable_filename = at_file['fields'][config.FULL_FILE_NAME]
                 except Exception as e:
                     logging.error('Error retreiving file name for record %s. Please fix this record and continue' % RID)
-                    error_count += 1
+                    counter_dict['error_counter'] += 1
+                    continue
                 try:                                        #checks to see if record has an entry in the checksum field. This will only process records with existing checksums
                     airtable_checksum = at_file['fields'][config.CHECKSUM]
                 except Exception as e:
                     logging.warning('No Checksum found for record %s. Skipping validation. Please run checksum creation subprocess to ensure records are up to date.' % (RID))
                     continue
                 file_path = os.path.join('/Volumes', drive_name, RID, airtable_filename)    #will need to fix this to make it cross platform eventually
-                file_dict = {"RID": RID, "file_record_id": file_record_id, "airtable_checksum": airtable_checksum, "file_path": file_path}
+                if journal and isJournaled(journal, file_record_id, file_path):
+                    counter_dict['resumed_counter'] += 1
+                    continue
+                file_dict = {"RID": RID, "file_record_id": file_record_id, "airtable_checksum": airtable_checksum, "airtable_fields": at_file['fields'], "file_path": file_path}
                 file_dict_list.append(file_dict)
-
-    file_dict_list_sorted = sorted(file_dict_list, key=lambda d: d['RID'])     #sorts the list so the user can see the big numbers go up!
-    for file_dict_entry in file_dict_list_sorted:
-        #these next four lines are just here to show how to access dictionary entries for file info from airtable
-        #print("RID: " + file_dict_entry["RID"])
-        #print("file_record_id: " + file_dict_entry["file_record_id"])
-        #print("airtable_checksum: " + file_dict_entry["airtable_checksum"])
-        #print("file_path: " + file_dict_entry["file_path"])
-
-        file_checksum = generateHash(file_dict_entry["file_path"]) #this is where we actually get the checksum
-        if file_checksum == file_dict_entry["airtable_checksum"]:
-            logging.info('Checksum validation succesful for record %s' % file_dict_entry["RID"])
-            update_dict = {config.CHECKSUM_VALID: 'Yes', config.CHECKSUM_VALID_DATE: datetime.today().strftime('%Y-%m-%d')}
-            checksum_validate_counter += 1
-        else:
-            logging.error('Checksum validation failed for record %s' % file_dict_entry["RID"])
-            update_dict = {config.CHECKSUM_VALID: 'No', config.CHECKSUM_VALID_DATE: datetime.today().strftime('%Y-%m-%d')}
-            checksum_error_counter += 1
-
-        #THIS IS THE IMPORTANT BIT WHERE WE UPDATE THE TABLE!
-        try:
-            airtable.update(file_dict_entry["file_record_id"], update_dict)
-            logging.info('Succesfully updated checksum validation date for record %s ' % file_dict_entry["RID"])
-            update_counter += 1
-        except Exception as e:
-            print(e)
-            logging.error('Could not update checksum validation for record %s' % file_dict_entry["RID"])
-            checksum_error_counter += 1
-
-    logging.info('Checksum Validation complete. %i records succesfully validated, %i Airtable records updated, %i errors encountered. ' % (checksum_validate_counter, update_counter, checksum_error_counter))
-    return
+        if sort_pages:
+            file_dict_list = sorted(file_dict_list, key=lambda d: d['RID'])
+        for file_dict in file_dict_list:
+            yield file_dict
 
 def deaccession():
     print('Performing deaccession')
     logging.info('Performing deaccession')
     drive_name = config.DRIVE_NAME
-    airtable = Airtable(config.BASE_ID, "Records", config.API_KEY)
-    airtable_files = Airtable(config.BASE_ID, 'Files', config.API_KEY)
     deaccession_errors = 0
     deaccession_success = 0
-    airtable_files_deleted = 0
-    airtable_errors = 0
-    pages = airtable.get_iter()
+    file_delete_list = []     #file records are collected here and deleted from Airtable in batches once the drive is cleaned up
+    #only ask Airtable for deaccessioned records, and only the fields we need from them
+    pages = getAirtablePages("Records", fields=[config.RECORD_NUMBER, config.RECORD_STATUS, config.FILES_IN_RECORD], formula=formulaEquals(config.RECORD_STATUS, config.RECORD_DEACCESS_FLAG), mirror_where="status = ?", mirror_params=(config.RECORD_DEACCESS_FLAG,))
     trash_path = os.path.join('/Volumes', drive_name, "_Trash")
     if os.path.isdir(trash_path):
         logging.info('Trash folder already exists')
@@ -544,37 +961,247 @@ def deaccession():
                     try:
                         airtable_file_id_list = record['fields'][config.FILES_IN_RECORD]
                         for f_id in airtable_file_id_list:
-                            try:
-                                airtable.delete(f_id)
-                                logging.info('Succesfully removed file records related to %s from Airtable' % RID)
-                                airtable_files_deleted += 1
-                            except:
-                                logging.error('Could not remove file records related to %s from Airtable' % RID)
-                                airtable_errors += 1
+                            file_delete_list.append({'record_id' : f_id, 'RID' : RID})
                     except:
                         logging.warning('No Airtable file records related to %s. This is not necessarily a problem' % RID)
                 else:
                     pass        #if the record isn't found on the drive there's no need to deaccession
 
+    #Deletes are sent in batches of 10, retrying if Airtable tells us to slow down
+    counter_dict = {'delete_counter' : 0, 'error_counter' : 0}
+    counter_dict = deleteAirtableRecords("Files", file_delete_list, counter_dict)
+    clearAirtableSnapshot("Files")     #file records were removed, so the audits need a fresh copy of the Files table
 
-    logging.info('Auto deaccession complete. %i records succesfully deaccessioned, %i errors encountered. %i Airtable file records deleted, %i Airtable errors encountered' % (deaccession_success, deaccession_errors, airtable_files_deleted, airtable_errors))
+    logging.info('Auto deaccession complete. %i records succesfully deaccessioned, %i errors encountered. %i Airtable file records deleted, %i Airtable errors encountered' % (deaccession_success, deaccession_errors, counter_dict['delete_counter'], counter_dict['error_counter']))
     return
 
 def getChecksums():
     #This section harvests file checksums and puts them in Airtable's Checksum field
     #For now it will only get the first filename, and warns if there is more than one file in the folder
+    #Files are hashed page by page as Airtable sends them, so the drive is busy while the rest of the table downloads
+    #(unless the audits already loaded the Files table, see validateChecksums)
     drive_name = config.DRIVE_NAME
-    airtable = Airtable(config.BASE_ID, "Files", config.API_KEY)
     print('Harvesting Checksums and updating airtable')
     logging.info('Harvesting Checksums and updating airtable')
-    update_counter = 0
+    counter_dict = {'update_counter' : 0, 'error_counter' : 0}    #filled in by the Airtable write queue as batches are sent
     checksum_counter = 0
     warning_counter = 0
     error_counter = 0
-    pages = getAirtablePages("Files")
+    stage_counter_dict = {'error_counter' : 0, 'file_counter' : 0, 'resumed_counter' : 0}
+    journal = resumeJournal('harvest', counter_dict)
+    pages = iterAirtablePages("Files")
 
-    file_dict_list = []
+    fingerprint_field = getFingerprintField()
+    for file_dict_entry, file_digests, hash_error in hashFileStage(fileHarvestStage(pages, drive_name, stage_counter_dict, journal=journal), fingerprint=bool(fingerprint_field)):
+        #these next four lines are just here to show how to access dictionary entries for file info from airtable
+        #print("RID: " + file_dict_entry["RID"])
+        #print("file_record_id: " + file_dict_entry["file_record_id"])
+        #print("airtable_checksum: " + file_dict_entry["airtable_checksum"])
+        #print("file_path: " + file_dict_entry["file_path"])
+
+        if hash_error is not None:
+            logging.error('Could not gather checksums for record %s, filename %s. Check that filename is correct' % (file_dict_entry["RID"], file_dict_entry["file_path"]))
+            error_counter += 1
+            continue
+        update_dict = createFixityUpdate(file_digests)     #MD5 goes in the Checksum field, the other algorithms in their own fields
+        if fingerprint_field:
+            update_dict[fingerprint_field] = file_dict_entry["fingerprint"]
+        checksum_counter += 1
+        updateRecordManifest(file_dict_entry, file_digests)
+
+        #THIS IS THE IMPORTANT BIT WHERE WE UPDATE THE TABLE!
+        #Updates are journaled first, then queued and sent to Airtable 10 records at a time
+        journalHashed('harvest', file_dict_entry, file_digests, update_dict)
+        queueAirtableUpdate("Files", file_dict_entry["file_record_id"], update_dict, file_dict_entry["RID"], counter_dict, getJournalCallback('harvest'))
+
+    album_counter, album_error_counter = getAlbumChecksums(drive_name, counter_dict)
+    checksum_counter += album_counter
+    error_counter += album_error_counter
+    stage_counter_dict['file_counter'] += album_counter + album_error_counter
+
+    flushAirtableUpdates("Files")     #also sends any updates replayed from an interrupted run
+    closeJournal('harvest')
+    if stage_counter_dict['file_counter'] == 0 and stage_counter_dict['error_counter'] == 0 and counter_dict['update_counter'] == 0:
+        logging.info('All files in Airtable have checksums. No checksums will be updated. If you would like to regenerate checksums please remove the data in the "%s" field in Airtable and run this subprocess again.' % config.CHECKSUM)
+    else:
+        error_counter += counter_dict['error_counter'] + stage_counter_dict['error_counter']
+        if counter_dict['update_counter'] > 0:
+            clearAirtableSnapshot("Files")     #new checksums were written, so checksum validation needs a fresh copy of the Files table
+        logging.info('Checksum harvest complete. %i checksums generated, %i Airtable records updated, %i warnings encountered, %i errors encountered.' % (checksum_counter, counter_dict['update_counter'], warning_counter, error_counter))
+    return
+
+def getAlbumFiles(album_path):
+    #Returns the files in an album as paths relative to the record folder (album name/file name), skipping hidden files
+    album_name = os.path.basename(album_path)
+    return sorted([album_name + '/' + f for f in os.listdir(album_path) if not f.startswith('.') and os.path.isfile(os.path.join(album_path, f))])
+
+def albumStage(pages, drive_name, counter_dict, harvest):
+    #Yields an album dict for every album in the library. With harvest=True only albums with no checksum yet are
+    #yielded, otherwise only albums that have one
+    for page in pages:
+        for at_file in page:
+            try:
+                record_status = at_file['fields'][config.RECORD_STATUS_LOOKUP][0]
+            except Exception as e:
+                record_status = "none"
+            try:
+                file_format = at_file['fields'][config.FILE_FORMAT]
+            except Exception as e:
+                file_format = "none"
+            if file_format != "Album" or record_status == config.RECORD_DEACCESS_FLAG:
+                continue
+            if harvest == (config.CHECKSUM in at_file['fields']):
+                continue
+            RID = at_file['fields'][config.RECORD_NUMBER_LOOKUP][0]
+            try:
+                airtable_filename = at_file['fields'][config.FULL_FILE_NAME]
+            except Exception as e:
+                logging.error('Error retreiving album name for record %s. Please fix this record and continue' % RID)
+                counter_dict['error_counter'] += 1
+                continue
+            record_path = os.path.join('/Volumes', drive_name, RID)
+            album_path = os.path.join(record_path, airtable_filename)
+            if not os.path.isdir(album_path):
+                logging.error('Album folder %s not found for record %s' % (airtable_filename, RID))
+                counter_dict['error_counter'] += 1
+                continue
+            yield {"RID": RID, "file_record_id": at_file['id'], "record_path": record_path, "album_path": album_path, "airtable_fields": at_file['fields'], "digests": {}, "problems": []}
+
+def getAlbumChecksums(drive_name, counter_dict):
+    #Hashes every file of every album that doesn't have a checksum yet (several files at once), writes the file checksums
+    #to the record folder's manifests and puts the album's tree digest in its Checksum field. Returns (albums done, errors)
+    stage_counter_dict = {'error_counter' : 0}
+    album_list = list(albumStage(getAirtablePages("Files"), drive_name, stage_counter_dict, harvest=True))
+    file_dicts = []
+    for album in album_list:
+        logging.info('No Checksum found for album in record %s . Checksums will be harvested for every file in the album.' % album["RID"])
+        for relative_path in getAlbumFiles(album["album_path"]):
+            file_dicts.append({"RID": album["RID"], "file_path": os.path.join(album["record_path"], relative_path), "relative_path": relative_path, "album": album})
+
+    for file_dict_entry, file_digests, hash_error in hashFileStage(file_dicts):
+        album = file_dict_entry["album"]
+        if hash_error is not None:
+            album["problems"].append('could not read %s: %s' % (file_dict_entry["relative_path"], hash_error))
+            continue
+        album["digests"][file_dict_entry["relative_path"]] = file_digests
+        album.setdefault("state", {})[file_dict_entry["relative_path"]] = [file_dict_entry["file_stat"].st_size, file_dict_entry["file_stat"].st_mtime]
+
+    album_counter = 0
+    for album in album_list:
+        if album["problems"]:
+            logging.error('Could not gather checksums for album in record %s: %s' % (album["RID"], '; '.join(album["problems"])))
+            stage_counter_dict['error_counter'] += 1
+            continue
+        try:
+            writeManifests(album["record_path"], album["digests"])
+            writeAlbumState(album["record_path"], dict(readAlbumState(album["record_path"]), **album.get("state", {})))
+        except Exception as e:
+            logging.error('Could not write the checksum manifest for album in record %s: %s' % (album["RID"], e))
+            stage_counter_dict['error_counter'] += 1
+            continue
+        queueAirtableUpdate("Files", album["file_record_id"], createFixityUpdate(generateTreeHashes(album["digests"])), album["RID"], counter_dict)
+        album_counter += 1
+    return album_counter, stage_counter_dict['error_counter']
+
+def prepareAlbumValidation(album, full=True):
+    #Checks an album against its manifest without reading any file contents: the manifest's tree digest has to match the
+    #album's Checksum field in Airtable, and every file in the album folder has to be in the manifest (and the other way round).
+    #Returns the file dicts of the album files to re-hash, all of them with full=True, otherwise only the files whose size or
+    #modified time changed since they were last hashed
+    album_name = os.path.basename(album["album_path"])
+    album["file_count"] = 0
+    album["hashed_count"] = 0
+    album["file_size"] = 0
+    album["missing_update"] = {}
+    try:
+        manifest_dict = readManifests(album["record_path"])
+    except Exception as e:
+        album["problems"].append('could not read the manifest: %s' % e)
+        return []
+    album["manifest"] = {relative_path : digests for relative_path, digests in manifest_dict.items() if relative_path.startswith(album_name + '/')}
+    album["state"] = readAlbumState(album["record_path"])
+    if not album["manifest"]:
+        album["problems"].append('no manifest found, remove the Checksum field in Airtable and run -gc to create one')
+        return []
+    tree_match, album["missing_update"] = compareFixity(generateTreeHashes(album["manifest"]), album["airtable_fields"])
+    if not tree_match:
+        album["problems"].append('the manifest does not match the Checksum in Airtable')
+    album_files = getAlbumFiles(album["album_path"])
+    album["file_count"] = len(album_files)
+    for relative_path in sorted(set(album["manifest"]) - set(album_files)):
+        album["problems"].append('%s is missing' % relative_path)
+    file_dicts = []
+    for relative_path in album_files:
+        if relative_path not in album["manifest"]:
+            album["problems"].append('%s is not in the manifest' % relative_path)
+            continue
+        file_path = os.path.join(album["record_path"], relative_path)
+        try:
+            file_stat = os.stat(file_path)
+        except OSError as e:
+            album["problems"].append('could not read %s: %s' % (relative_path, e))
+            continue
+        album["file_size"] += file_stat.st_size
+        if full or album["state"].get(relative_path) != [file_stat.st_size, file_stat.st_mtime]:
+            file_dicts.append({"RID": album["RID"], "file_path": file_path, "relative_path": relative_path, "file_size": file_stat.st_size, "album": album})
+    return file_dicts
+
+def albumValidationStage(drive_name, counter_dict, album_list, full=True):
+    #Yields the album files to re-hash for every album that has a checksum, after the album's metadata checks.
+    #Each album is added to album_list so finishAlbumValidation can write its result once its files are hashed
+    for album in albumStage(getAirtablePages("Files"), drive_name, counter_dict, harvest=False):
+        album_list.append(album)
+        for file_dict in prepareAlbumValidation(album, full):
+            yield file_dict
+
+def checkAlbumFile(file_dict, digests, hash_error):
+    #Compares a re-hashed album file against the album's manifest
+    album = file_dict["album"]
+    relative_path = file_dict["relative_path"]
+    if hash_error is not None:
+        album["problems"].append('could not read %s: %s' % (relative_path, hash_error))
+        return
+    manifest_digests = album["manifest"][relative_path]
+    if any(digests[algorithm] != digest for algorithm, digest in manifest_digests.items() if algorithm in digests):
+        album["problems"].append('%s does not match its checksum' % relative_path)
+        return
+    album["hashed_count"] += 1
+    album["state"][relative_path] = [file_dict["file_stat"].st_size, file_dict["file_stat"].st_mtime]
+
+def finishAlbumValidation(album_list, counter_dict):
+    #Writes the result of each album to Airtable. An album is only marked as validated (with today's date) if every one of
+    #its files was re-hashed this run. If only the changed files were read the album's metadata was checked, but its
+    #validated date is left alone so rolling validation still gets to it. Returns (albums validated, albums that failed or had errors)
+    album_validate_counter = 0
+    album_error_counter = 0
+    for album in album_list:
+        if album["problems"]:
+            logging.error('Checksum validation failed for album in record %s: %s' % (album["RID"], '; '.join(album["problems"])))
+            update_dict = {config.CHECKSUM_VALID: 'No', config.CHECKSUM_VALID_DATE: datetime.today().strftime('%Y-%m-%d')}
+            album_error_counter += 1
+        else:
+            try:
+                writeAlbumState(album["record_path"], album["state"])
+            except Exception as e:
+                logging.warning('Could not save the album state for record %s: %s' % (album["RID"], e))
+            if album["hashed_count"] == album["file_count"]:
+                logging.info('Checksum validation succesful for album in record %s' % album["RID"])
+                update_dict = {config.CHECKSUM_VALID: 'Yes', config.CHECKSUM_VALID_DATE: datetime.today().strftime('%Y-%m-%d')}
+                album_validate_counter += 1
+            else:
+                logging.info('Album metadata checked for record %s (%i of %i files re-hashed). The validated date is left as it is' % (album["RID"], album["hashed_count"], album["file_count"]))
+                update_dict = {}
+            update_dict.update(album["missing_update"])
+        if update_dict:
+            queueAirtableUpdate("Files", album["file_record_id"], update_dict, album["RID"], counter_dict)
+    return album_validate_counter, album_error_counter
+
+def fileHarvestStage(pages, drive_name, counter_dict, sort_pages=True, journal=None):
+    #Takes Files pages as they arrive and yields a file dict for every file that is missing a checksum.
+    #Each page is sorted by RID before it's handed on so the user can see the big numbers go up (within each page)
+    #Files already hashed by an interrupted run (see the checkpoint journal) are skipped
     for page in pages:
+        file_dict_list = []
         for at_file in page:
             try:
                 record_status = at_file['fields'][config.RECORD_STATUS_LOOKUP][0]
@@ -584,7 +1211,7 @@ def getChecksums():
                 file_format = at_file['fields'][config.FILE_FORMAT]
             except Exception as e:
                 file_format = "none"
-            if file_format == "Album":    #we can skip this whole process for Albums, they don't have checksums
+            if file_format == "Album":    #albums are handled on their own, see getAlbumChecksums and finishAlbumValidation
                 continue
             if record_status != config.RECORD_DEACCESS_FLAG:     #only process records that are in the library
                 file_record_id = at_file['id']
@@ -593,45 +1220,22 @@ def getChecksums():
                     airtable_filename = at_file['fields'][config.FULL_FILE_NAME]
                 except Exception as e:
                     logging.error('Error retreiving file name for record %s. Please fix this record and continue' % RID)
-                    error_count += 1
-                try:                                        #checks to see if record has an entry in the checksum field. This will only process records with existing checksums
-                    airtable_checksum = at_file['fields'][config.CHECKSUM]
+                    counter_dict['error_counter'] += 1
+                    continue
+                if config.CHECKSUM in at_file['fields']:     #only harvest checksums for files that don't have one yet
                     continue
-                except Exception as e:
-                    logging.info('No Checksum found for record %s . Checksum will be harvested.' % (RID))
                 file_path = os.path.join('/Volumes', drive_name, RID, airtable_filename)    #will need to fix this to make it cross platform eventually
+                if journal and isJournaled(journal, file_record_id, file_path):
+                    counter_dict['resumed_counter'] += 1
+                    continue
+                logging.info('No Checksum found for record %s . Checksum will be harvested.' % (RID))
                 file_dict = {"RID": RID, "file_record_id": file_record_id, "file_path": file_path}
                 file_dict_list.append(file_dict)
-
-    if len(file_dict_list) == 0:
-        logging.info('All files in Airtable have checksums. No checksums will be updated. If you would like to regenerate checksums please remove the data in the "%s" field in Airtable and run this subprocess again.' % config.CHECKSUM)
-    else:
-        file_dict_list_sorted = sorted(file_dict_list, key=lambda d: d['RID'])     #sorts the list so the user can see the big numbers go up!
-        for file_dict_entry in file_dict_list_sorted:
-            #these next four lines are just here to show how to access dictionary entries for file info from airtable
-            #print("RID: " + file_dict_entry["RID"])
-            #print("file_record_id: " + file_dict_entry["file_record_id"])
-            #print("airtable_checksum: " + file_dict_entry["airtable_checksum"])
-            #print("file_path: " + file_dict_entry["file_path"])
-
-            try:
-                checksum = generateHash(file_dict_entry["file_path"])
-                update_dict = {config.CHECKSUM: checksum}
-                checksum_counter += 1
-            except Exception as e:
-                logging.error('Could not gather checksums for record %s, filename %s. Check that filename is correct' % (file_dict_entry["RID"], file_dict_entry["file_path"]))
-                error_counter += 1
-                continue
-
-            #THIS IS THE IMPORTANT BIT WHERE WE UPDATE THE TABLE!
-            try:
-                airtable.update(file_dict_entry["file_record_id"], update_dict)
-                logging.info('Succesfully updated checksum for record %s ' % file_dict_entry["RID"])
-                update_counter += 1
-            except Exception as e:
-                logging.error('Could not update checksums for record %s' % file_dict_entry["RID"])
-        logging.info('Checksum harvest complete. %i checksums generated, %i Airtable records updated, %i warnings encountered, %i errors encountered.' % (checksum_counter, update_counter, warning_counter, error_counter))
-    return
+                counter_dict['file_counter'] += 1
+        if sort_pages:
+            file_dict_list = sorted(file_dict_list, key=lambda d: d['RID'])
+        for file_dict in file_dict_list:
+            yield file_dict
 
 #This is not really necessary anymore because all record folders are at the root level
 #def findRecord(UID, drive_name):